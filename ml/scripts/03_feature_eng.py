@@ -39,11 +39,25 @@ DIR = os.path.join(PROJECT_ROOT, "data", "processed")
 
 CONCURRENCY = 20   # try 20–50;
 
+# Images named by TMDB id. The old posters/ and backdrops/ folders named
+# them by dataframe row, and download_one skips existing files, so ids
+# must not share a folder with those row-numbered files
+POSTER_DIR = os.path.abspath("../data/images/posters_by_id")
+BACKDROP_DIR = os.path.abspath("../data/images/backdrops_by_id")
+
 def make_url(path, size="w185"):
     if not isinstance(path, str) or path.strip() == "":
         return None
     return f"https://image.tmdb.org/t/p/{size}/{path}"
 
+def image_filename(tmdb_id, path):
+    """
+    {tmdb id}_{tmdb file name}.jpg: a new poster/backdrop on TMDB gets a new
+    file name, so download_one fetches it instead of reusing the old file.
+    """
+    stem = os.path.splitext(os.path.basename(str(path)))[0]
+    return f"{tmdb_id}_{stem}.jpg"
+
 async def fetch_image(session, url):
     if url is None:
         return None
@@ -97,12 +111,14 @@ async def download_all_async(df):
         poster_tasks = []
         backdrop_tasks = []
 
-        for idx, row in df.iterrows():
+        for _, row in df.iterrows():
+            # named by tmdb id + tmdb path so files keep pointing at the same
+            # movie across refreshes and changed images are downloaded again
             poster_url = row["poster_url"]
-            poster_save = os.path.abspath(f"../data/images/posters/{idx}.jpg")
+            poster_save = os.path.join(POSTER_DIR, image_filename(row['id'], row['poster_path']))
 
             backdrop_url = row["backdrop_url"]
-            backdrop_save = os.path.abspath(f"../data/images/backdrops/{idx}.jpg")
+            backdrop_save = os.path.join(BACKDROP_DIR, image_filename(row['id'], row['backdrop_path']))
 
             poster_tasks.append(
                 download_one(semaphore, session, poster_url, poster_save)
@@ -127,12 +143,8 @@ if __name__ == '__main__':
     df["backdrop_url"] = df["backdrop_path"].apply(make_url)
 
     print('[3] creating image folders...')
-    base_img_path = os.path.abspath("../data/images")
-    poster_dir = os.path.join(base_img_path, "posters")
-    backdrop_dir = os.path.join(base_img_path, "backdrops")
-
-    os.makedirs(poster_dir, exist_ok=True)
-    os.makedirs(backdrop_dir, exist_ok=True)
+    os.makedirs(POSTER_DIR, exist_ok=True)
+    os.makedirs(BACKDROP_DIR, exist_ok=True)
 
     print('[4] downloading images async...')
 
@@ -141,8 +153,9 @@ if __name__ == '__main__':
     df["poster_file"] = poster_paths
     df["backdrop_file"] = backdrop_paths
 
-    print('[5] dropping unused URL/path columns...')
-    df = df.drop(columns=["poster_path", "backdrop_path", "poster_url", "backdrop_url"])
+    print('[5] dropping unused URL columns...')
+    # poster_path/backdrop_path stay: content_hash uses them to detect new images
+    df = df.drop(columns=["poster_url", "backdrop_url"])
 
     print('[6] extracting year + month_sin/cos features...')
     df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce')
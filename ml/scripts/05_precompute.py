@@ -1,167 +1,28 @@
 import os
 import pickle
-import re
-from typing import Optional
 
-import pandas as pd
 import torch
-from PIL import Image
-from torchvision.transforms import InterpolationMode
-from tqdm import tqdm
 
 from ml.src.processing.cnn_encoder import ResNet50Encoder
+from ml.src.processing.embedding_cache import EmbeddingCache
 from ml.src.processing.keywords_encoder import WordEmbedding
+from ml.src.processing.precompute import CONTENT_HASHES_FILE, content_hash, precompute_shard, shard_inputs_digest
 from ml.src.processing.sbert_encoder import MPNetEncoder
-
-from torchvision import transforms
+from ml.src.processing.shards import assemble_shards, is_shard_done, save_shard, shard_ranges
+from ml.src.utils.feature_store import save_feature_store
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
 DIR = os.path.join(PROJECT_ROOT, "data", "processed")
+CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "cache", "embeddings.sqlite")  # shared by all precompute scripts
+SHARD_DIR = os.path.join(DIR, "shards", "features")
 
-FEATURE_IDX = {
-    "text": 0,
-    "keywords": 1,
-    "genres": 2,
-    "year": 3,
-    "month_sin": 4,
-    "month_cos": 5,
-    "vote_average": 6,
-    "vote_count": 7,
-    "popularity": 8,
-    "runtime": 9,
-    "poster": 10,
-    "backdrop": 11
-}
-
-ALL_GENRES = [
-    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama',
-    'Family', 'Fantasy', 'History', 'Horror', 'Music', 'Mystery', 'Romance',
-    'Science Fiction', 'TV Movie', 'Thriller', 'War', 'Western'
-]
-
-GENRE_IDX = {genre: i for i, genre in enumerate(ALL_GENRES)}
-
-def clean_text(x):
-    # 1. Handle missing or nan
-    if pd.isna(x) or not x or str(x).lower() == "nan":
-        return ""
-
-    text = str(x)
-
-    # 2. Remove weird whitespace
-    text = text.replace("\n", " ").replace("\t", " ")
-
-    # 3. Collapse multiple spaces
-    text = re.sub(r"\s+", " ", text)
-
-    # 4. Remove duplicate punctuation
-    text = re.sub(r"[.]{2,}", ".", text)
-    text = re.sub(r"[,]{2,}", ",", text)
-    text = re.sub(r"[!]{2,}", "!", text)
-    text = re.sub(r"[?]{2,}", "?", text)
-
-    # 5. Strip leading/trailing spaces & punctuation
-    return text.strip().strip(".")
-
-def get_text_features(movie_item, sbert_encoder) -> Optional[torch.Tensor]:
-    title = clean_text(movie_item.get("title"))
-    tagline = clean_text(movie_item.get("tagline"))
-    overview = clean_text(movie_item.get("overview"))
-
-    parts = []
-    if title:
-        parts.append(f"{title}.")
-    if tagline:
-        parts.append(f"{tagline}.")
-    if overview:
-        parts.append(f"{overview}.")
-
-    text = " ".join(parts)
-
-    if not text:
-        return None
-
-    with torch.no_grad():
-        embedding = sbert_encoder(text)  # if its empty sbert will just give it a default encoding
-    return embedding.cpu()
-
-def precompute_keywords(movie_item, words : WordEmbedding) -> Optional[torch.Tensor]:
-    keywords_raw = movie_item.get("keywords")
-
-    # Check for NaN before passing to split_keywords
-    if pd.isna(keywords_raw) or not keywords_raw:
-        return None
-
-    keywords = words.split_keywords(keywords_raw) # makes sure keywords are in glove 840b.300d
-
-    if not keywords:
-        return None
-
-    embeddings = [words.get_embedding(keyword) for keyword in keywords]
-
-    if not embeddings:
-        return None
-
-    embeddings_tensor = torch.vstack(embeddings)  # shape: [len(words), 300]
-    pooled_embedding = embeddings_tensor.mean(dim=0)  # shape: [300]
-    return pooled_embedding
-
-def one_hot_encode_genres(movie_item) -> Optional[torch.Tensor]:
-    movie_genres = movie_item.get('genres')
-
-    if pd.isna(movie_genres) or not movie_genres:
-        return None
-
-    movie_genres = [g.strip() for g in movie_genres.split(',') if g.strip()]
-
-    movie_genre_features = torch.zeros(len(GENRE_IDX), dtype=torch.float32)
-    for g in movie_genres:
-        if g in GENRE_IDX:
-            movie_genre_features[GENRE_IDX[g]] = 1.0
-
-    if movie_genre_features.sum() == 0:
-        return None
-
-    return movie_genre_features
-
-def precompute_images(resnet_encoder : ResNet50Encoder, path) -> Optional[torch.Tensor]:
-    if pd.isna(path) or not path:
-        return None
-
-    if not os.path.exists(path):
-        return None
-
-    transform = transforms.Compose([
-        transforms.RandomCrop((280, 280), pad_if_needed=True),
-        transforms.Resize(224, interpolation=InterpolationMode.BILINEAR),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406],
-                             [0.229, 0.224, 0.225])
-    ])
-
-    img = Image.open(path).convert("RGB")
-    img_tensor = transform(img).unsqueeze(0).to(next(resnet_encoder.parameters()).device)
-
-    with torch.no_grad():
-        poster_embed = resnet_encoder.forward(img_tensor).squeeze(0)
-
-    return poster_embed.cpu()
-
-def _set(features_array, mask_array, index, feature_idx, value):
-    """
-    Assign a value to a feature array and update the mask.
-    """
-    if value is not None:
-        features_array[index] = value
-        mask_array[index, feature_idx] = 1.0
-    else:
-        mask_array[index, feature_idx] = 0.0
-
-def to_tensor_or_none(value) -> Optional[torch.Tensor]:
-    if pd.isna(value):
-        return None
-    return torch.tensor([value], dtype=torch.float32)
+SHARD_SIZE = 50_000      # movies persisted per shard, a crash only loses the current one
+MOVIE_BATCH_SIZE = 1024  # movies gathered per encoding round
+TEXT_BATCH_SIZE = 128    # sentences per SentenceTransformer.encode batch
+IMAGE_BATCH_SIZE = 64    # images stacked per CNN forward
+IMAGE_WORKERS = 8        # processes decoding/transforming posters and backdrops
+CACHE_MAX_BYTES = 32 * 1024 ** 3
 
 if __name__ == "__main__":
     # Load mappings
@@ -178,80 +39,50 @@ if __name__ == "__main__":
     resnet = ResNet50Encoder().to(device) # 512 dim
     word2vec = WordEmbedding() # 300 dim
 
-    # Prepare storage (using indices)
-    text_features = torch.zeros((num_movies, 768), dtype=torch.float32) # includes "TITLE: {title} TAGLINE: {tagline} OVERVIEW: {overview}"
-    keywords_features = torch.zeros((num_movies, 300), dtype=torch.float32)  # make sure to split ,
-    genre_features = torch.zeros((num_movies, len(ALL_GENRES)), dtype=torch.float32)  # make sure to split ,
-    year_features = torch.zeros((num_movies, 1), dtype=torch.float32)
-    month_sin_features = torch.zeros((num_movies, 1), dtype=torch.float32)
-    month_cos_features = torch.zeros((num_movies, 1), dtype=torch.float32)
-    vote_average_features = torch.zeros((num_movies, 1), dtype=torch.float32)
-    vote_count_features = torch.zeros((num_movies, 1), dtype=torch.float32)
-    popularity_features = torch.zeros((num_movies, 1), dtype=torch.float32)
-    runtime_features = torch.zeros((num_movies, 1), dtype=torch.float32)
-    poster_file_features = torch.zeros((num_movies, 512), dtype=torch.float32)
-    backdrop_file_features = torch.zeros((num_movies, 512), dtype=torch.float32)
-
-    mask_features = torch.zeros((num_movies, len(FEATURE_IDX)), dtype=torch.float32)
-
-    for i, (tmdb_id, movie) in enumerate(tqdm(movie_db.items(), desc="Encoding movies")):
-        idx = mappings['tmdb_to_idx'][tmdb_id]  # Get array index
-
-        text_emb = get_text_features(movie, sbert)
-        _set(text_features, mask_features, idx, FEATURE_IDX['text'], text_emb)
-
-        keywords_emb = precompute_keywords(movie, word2vec)
-        _set(keywords_features, mask_features, idx, FEATURE_IDX['keywords'], keywords_emb)
-
-        genres = one_hot_encode_genres(movie)
-        _set(genre_features, mask_features, idx, FEATURE_IDX['genres'], genres)
+    cache = EmbeddingCache(CACHE_PATH, max_bytes=CACHE_MAX_BYTES)
 
-        year = to_tensor_or_none(movie.get('release_year'))
-        _set(year_features, mask_features, idx, FEATURE_IDX['year'], year)
+    # a shard is only reused if it was encoded by the same models
+    encoder_keys = [cache.encoder_key(sbert), cache.encoder_key(resnet), f"glove:{len(word2vec.stoi)}", 768, 512]
 
-        month_sin = to_tensor_or_none(movie.get('month_sin'))
-        _set(month_sin_features, mask_features, idx, FEATURE_IDX['month_sin'], month_sin)
+    # hashes of the inputs as encoded now, incremental_update diffs against them
+    content_hashes = {tmdb_id: content_hash(movie) for tmdb_id, movie in movie_db.items()}
 
-        month_cos = to_tensor_or_none(movie.get('month_cos'))
-        _set(month_cos_features, mask_features, idx, FEATURE_IDX['month_cos'], month_cos)
+    ranges = shard_ranges(num_movies, SHARD_SIZE)
 
-        vote_average = to_tensor_or_none(movie.get('vote_average'))
-        _set(vote_average_features, mask_features, idx, FEATURE_IDX['vote_average'], vote_average)
+    for shard_id, (start, end) in enumerate(ranges):
+        tmdb_ids = [mappings['idx_to_tmdb'][idx] for idx in range(start, end)]
+        movies = [movie_db[tmdb_id] for tmdb_id in tmdb_ids]
+        inputs_digest = shard_inputs_digest(movies, encoder_keys, [content_hashes[tmdb_id] for tmdb_id in tmdb_ids])
 
-        vote_count = to_tensor_or_none(movie.get('vote_count'))
-        _set(vote_count_features, mask_features, idx, FEATURE_IDX['vote_count'], vote_count)
+        if is_shard_done(SHARD_DIR, shard_id, tmdb_ids, inputs_digest):
+            print(f"Shard {shard_id + 1}/{len(ranges)} already done, skipping")
+            continue
 
-        popularity = to_tensor_or_none(movie.get('popularity'))
-        _set(popularity_features, mask_features, idx, FEATURE_IDX['popularity'], popularity)
+        print(f"Shard {shard_id + 1}/{len(ranges)}: movies {start} to {end - 1}")
 
-        runtime = to_tensor_or_none(movie.get('runtime'))
-        _set(runtime_features, mask_features, idx, FEATURE_IDX['runtime'], runtime)
+        # text includes "{title}. {tagline}. {overview}."
+        features = precompute_shard(
+            movies=movies,
+            sbert_encoder=sbert,
+            img_encoder=resnet,
+            words=word2vec,
+            text_dim=768,
+            image_dim=512,
+            movie_batch_size=MOVIE_BATCH_SIZE,
+            text_batch_size=TEXT_BATCH_SIZE,
+            image_batch_size=IMAGE_BATCH_SIZE,
+            num_workers=IMAGE_WORKERS,
+            cache=cache
+        )
 
-        poster_path = movie.get('poster_file')
-        poster_emb = precompute_images(resnet, poster_path)
-        _set(poster_file_features, mask_features, idx, FEATURE_IDX['poster'], poster_emb)
+        save_shard(SHARD_DIR, shard_id, tmdb_ids, inputs_digest, features)
 
-        backdrop_path = movie.get('backdrop_file')
-        backdrop_emb = precompute_images(resnet, backdrop_path)
-        _set(backdrop_file_features, mask_features, idx, FEATURE_IDX['backdrop'], backdrop_emb)
+    print(f"Embedding cache hits: {cache.hits}, misses: {cache.misses}")
+    cache.close()
 
-        if i % 100 == 0:
-            torch.cuda.empty_cache()
+    features = assemble_shards(SHARD_DIR, len(ranges))
 
-    features = {
-        "text": text_features,
-        "keywords": keywords_features,
-        "genres": genre_features,
-        "year": year_features,
-        "month_sin": month_sin_features,
-        "month_cos": month_cos_features,
-        "vote_average": vote_average_features,
-        "vote_count": vote_count_features,
-        "popularity": popularity_features,
-        "runtime": runtime_features,
-        "poster_file": poster_file_features,
-        "backdrop_file": backdrop_file_features,
-        "mask": mask_features
-    }
+    save_feature_store(features, os.path.join(DIR, "features"))
 
-    torch.save(features, os.path.join(DIR, "features.pt"))
\ No newline at end of file
+    with open(os.path.join(DIR, CONTENT_HASHES_FILE), "wb") as f:
+        pickle.dump(content_hashes, f)
@@ -0,0 +1,30 @@
+"""
+  Builds the compact GloVe subset used by WordEmbedding: only the words that
+  actually appear in the dataset keywords, saved as a memory-mappable
+  vocab.txt + vectors.npy under data/cache/glove_subset.
+
+  Run once after 02_clean_dataset (and again when the dataset changes).
+"""
+
+import os
+
+import pandas as pd
+
+from ml.src.processing.keywords_encoder import SUBSET_DIR, WordEmbedding, tokenize_keywords
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
+DIR = os.path.join(PROJECT_ROOT, "data", "processed")
+
+if __name__ == '__main__':
+    df = pd.read_csv(os.path.join(DIR, "movie_dataset_cleaned.csv"), usecols=['keywords'])
+
+    tokens = set()
+    for keywords in df['keywords'].dropna():
+        tokens.update(tokenize_keywords(keywords))
+
+    # full 840B table, loaded this one time
+    glove = WordEmbedding(name='840B', dim=300, subset_dir=None)
+    vocab = glove.save_subset(tokens, SUBSET_DIR)
+
+    print(f"Saved {len(vocab)} of {len(tokens)} keyword tokens to {SUBSET_DIR}")
@@ -0,0 +1,184 @@
+"""
+  Incremental refresh, run after 02_clean_dataset and 03_feature_eng in
+  place of 04_movie_node_mapping and 05_precompute.
+
+  Diffs the processed CSV against the existing mappings.pkl/feature store by
+  TMDB id plus a content hash of the encoded fields (compared with the hashes
+  stored when the features were encoded), encodes only new or
+  changed movies and patches the feature store, the mappings and embeddings.pt.
+  New movies are appended after the existing indices so rows already in
+  the feature store and embeddings.pt keep their position.
+"""
+
+import os
+import pickle
+
+import pandas as pd
+import torch
+
+from ml.src.processing.cnn_encoder import ResNet50Encoder
+from ml.src.processing.embedding_cache import EmbeddingCache
+from ml.src.processing.generate_embeddings import update_embeddings
+from ml.src.processing.keywords_encoder import WordEmbedding
+from ml.src.processing.precompute import (
+    CONTENT_HASHES_FILE, SCALAR_COLUMNS, allocate_features, content_hash, precompute_metadata, precompute_shard
+)
+from ml.src.processing.sbert_encoder import MPNetEncoder
+from ml.src.utils.feature_store import load_features, save_feature_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, ".."))
+DIR = os.path.join(PROJECT_ROOT, "data", "processed")
+CACHE_PATH = os.path.join(PROJECT_ROOT, "data", "cache", "embeddings.sqlite")  # shared by all precompute scripts
+
+SHARD_SIZE = 50_000
+MOVIE_BATCH_SIZE = 1024
+TEXT_BATCH_SIZE = 128
+IMAGE_BATCH_SIZE = 64
+IMAGE_WORKERS = 8
+CACHE_MAX_BYTES = 32 * 1024 ** 3
+
+METADATA_KEYS = ["genres", *SCALAR_COLUMNS, "mask"]
+
+def load_content_hashes(mappings):
+    """
+    Hashes stored when the feature store was encoded. Stores written before
+    they were kept fall back to hashing the old rows, which misses image
+    changes (old and new row stat the same local file).
+    """
+    path = os.path.join(DIR, CONTENT_HASHES_FILE)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    print(f"[WARN] {CONTENT_HASHES_FILE} not found, diffing against old rows (image changes are not detected)")
+    return {tmdb_id: content_hash(movie) for tmdb_id, movie in mappings['movie_database'].items()}
+
+def diff_movies(movies, mappings, stored_hashes):
+    """
+    Args:
+        movies: dict tmdb_id -> row of the new processed CSV
+        mappings: existing mappings.pkl
+        stored_hashes: tmdb_id -> content_hash at encode time
+
+    Returns:
+        new_ids, changed_ids, removed_ids (sorted TMDB ids) and
+        the current content_hash of every movie
+    """
+    tmdb_to_idx = mappings['tmdb_to_idx']
+
+    hashes = {tmdb_id: content_hash(movie) for tmdb_id, movie in movies.items()}
+
+    new_ids = []
+    changed_ids = []
+    for tmdb_id in movies:
+        if tmdb_id not in tmdb_to_idx:
+            new_ids.append(tmdb_id)
+        elif hashes[tmdb_id] != stored_hashes.get(tmdb_id):
+            changed_ids.append(tmdb_id)
+
+    removed_ids = [tmdb_id for tmdb_id in tmdb_to_idx if tmdb_id not in movies]
+
+    return sorted(new_ids), sorted(changed_ids), sorted(removed_ids), hashes
+
+if __name__ == '__main__':
+    df = pd.read_csv(os.path.join(DIR, "movie_dataset_processed.csv"))
+    movies = {movie['id']: movie for movie in sorted(df.to_dict(orient='records'), key=lambda x: x['id'])}
+
+    with open(os.path.join(DIR, 'mappings.pkl'), 'rb') as f:
+        mappings = pickle.load(f)
+
+    features = load_features(os.path.join(DIR, 'features'))
+
+    stored_hashes = load_content_hashes(mappings)
+    new_ids, changed_ids, removed_ids, hashes = diff_movies(movies, mappings, stored_hashes)
+    print(f"new: {len(new_ids)}, changed: {len(changed_ids)}, removed: {len(removed_ids)} (kept in place)")
+
+    # Append new movies after the existing indices
+    num_old = features['text'].shape[0]
+    for offset, tmdb_id in enumerate(new_ids):
+        mappings['tmdb_to_idx'][tmdb_id] = num_old + offset
+        mappings['idx_to_tmdb'][num_old + offset] = tmdb_id
+
+    mappings['movie_database'].update(movies)
+
+    if new_ids:
+        extra = allocate_features(
+            len(new_ids),
+            text_dim=features['text'].shape[1],
+            image_dim=features['poster_file'].shape[1]
+        )
+        features = {k: torch.cat([v, extra[k]], dim=0) for k, v in features.items()}
+
+    # 03_feature_eng refits the scalers every run, so refresh genres and
+    # scalars for every movie (cheap) and remember which rows moved
+    current_idx = torch.tensor([mappings['tmdb_to_idx'][tmdb_id] for tmdb_id in movies], dtype=torch.long)
+    before = {key: features[key][current_idx].clone() for key in METADATA_KEYS}
+
+    precompute_metadata(list(movies.values()), current_idx, features)
+
+    metadata_changed = torch.zeros(len(current_idx), dtype=torch.bool)
+    for key in METADATA_KEYS:
+        metadata_changed |= (features[key][current_idx] != before[key]).any(dim=1)
+    touched = set(current_idx[metadata_changed].tolist())
+
+    # Re-encode only new and changed movies
+    to_encode = new_ids + changed_ids
+    if to_encode:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        print("Using:", device)
+
+        sbert = MPNetEncoder().to(device) # 768 dim
+        resnet = ResNet50Encoder().to(device) # 512 dim
+        word2vec = WordEmbedding() # 300 dim
+
+        # new keywords missing from the GloVe subset would be silently dropped
+        missing = word2vec.missing_tokens(movies[tmdb_id].get('keywords') for tmdb_id in to_encode)
+        if missing:
+            print(f"{len(missing)} keyword tokens not in the GloVe subset, rebuilding it")
+            word2vec = word2vec.extend_subset(missing)
+
+        cache = EmbeddingCache(CACHE_PATH, max_bytes=CACHE_MAX_BYTES)
+
+        for start in range(0, len(to_encode), SHARD_SIZE):
+            chunk_ids = to_encode[start:start + SHARD_SIZE]
+            rows = torch.tensor([mappings['tmdb_to_idx'][tmdb_id] for tmdb_id in chunk_ids], dtype=torch.long)
+
+            encoded = precompute_shard(
+                movies=[movies[tmdb_id] for tmdb_id in chunk_ids],
+                sbert_encoder=sbert,
+                img_encoder=resnet,
+                words=word2vec,
+                text_dim=768,
+                image_dim=512,
+                movie_batch_size=MOVIE_BATCH_SIZE,
+                text_batch_size=TEXT_BATCH_SIZE,
+                image_batch_size=IMAGE_BATCH_SIZE,
+                num_workers=IMAGE_WORKERS,
+                cache=cache
+            )
+
+            for key, value in encoded.items():
+                features[key][rows] = value
+
+            touched.update(rows.tolist())
+
+        cache.close()
+
+    save_feature_store(features, os.path.join(DIR, "features"))
+
+    # every current movie is now encoded from these inputs
+    stored_hashes.update(hashes)
+    with open(os.path.join(DIR, CONTENT_HASHES_FILE), "wb") as f:
+        pickle.dump(stored_hashes, f)
+
+    with open(os.path.join(DIR, "mappings.pkl"), "wb") as f:
+        pickle.dump(mappings, f)
+
+    with open(os.path.join(DIR, "mappings_no_dataset.pkl"), "wb") as f:
+        pickle.dump({'tmdb_to_idx': mappings['tmdb_to_idx'], 'idx_to_tmdb': mappings['idx_to_tmdb']}, f)
+
+    print(f"Updated features for {len(touched)} movies, total {features['text'].shape[0]}")
+
+    if os.path.exists(os.path.join(DIR, "embeddings.pt")):
+        update_embeddings(sorted(touched))
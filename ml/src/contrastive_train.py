@@ -38,11 +38,16 @@ import os
 import torch
 import torch.optim as optim
 from torch.optim.lr_scheduler import LinearLR, CosineAnnealingLR, SequentialLR
+from torch.nn.parallel import DistributedDataParallel
 from tqdm import tqdm
 
-from models.fusion_model import MovieFusionModel
-from utils.dataset import get_dataloader
+from models.fusion_metrics import FusionMetrics
+from models.fusion_model import MovieFusionModel, export_model
+from utils.checkpoint import AsyncCheckpointWriter, atomic_save
+from utils.dataset import DeviceBatchLoader, get_dataloader, set_epoch
+from utils.distributed import all_gather, cleanup_distributed, setup_distributed
 from utils.losses import contrastive_loss
+from utils.memory_queue import MemoryQueue, momentum_copy, momentum_update
 
 # --- Config ---
 BATCH_SIZE = 256
@@ -50,18 +55,54 @@ LEARNING_RATE = 1e-4
 EPOCHS = 100
 WARMUP_EPOCHS = 10
 TEMPERATURE = 0.1
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+LOSS_CHUNK_SIZE = 4096  # similarity rows per block in the loss, None for the full matrix
+# MoCo-style negatives queue, off by default since it changes the objective.
+# Enable with e.g. QUEUE_SIZE = 16384 (recent view-2 embeddings kept as extra
+# negatives) and MOMENTUM = 0.999 (EMA copy of the model encodes them; None
+# queues the model's own view-2 embeddings, no extra forward)
+QUEUE_SIZE = 0
+MOMENTUM = None
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")  # per-rank device under torchrun
+# fp32 / bf16 / fp16. fp16 + GradScaler on GPUs (bf16 needs Ampere or newer),
+# bf16 autocast on CPU
+PRECISION = "fp16" if DEVICE.type == "cuda" else "bf16"
 SAVE_DIR = "checkpoints"
-DATA_PATH = "features.pt"
+KEEP_CHECKPOINTS = 3  # model_epoch_N.pt files kept, latest_checkpoint.pt is always kept
+DATA_PATH = "features"  # feature store written by the precompute scripts
+IN_MEMORY = True  # keep all features on DEVICE and skip the DataLoader (needs the feature set to fit in memory)
+
+COMPILE = False  # torch.compile the model for training (first batches are slow while it compiles)
+LOG_FUSION_METRICS = False  # per-epoch attention / modality coverage / stage timings (adds syncs on GPU)
+
+AMP_DTYPES = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
 
 os.makedirs(SAVE_DIR, exist_ok=True)
 
 # --- TRAINING LOOP ---
+# Distributed: torchrun --nproc_per_node=N contrastive_train.py
+# BATCH_SIZE is per rank, the loss sees the negatives of all ranks
 def train():
-    dataloader = get_dataloader(
-        features_file=DATA_PATH,
-        batch_size=BATCH_SIZE,
-    )
+    rank, world_size, device = setup_distributed(DEVICE)
+    is_main = rank == 0
+    # pinned host memory + async copies only help (and only work) with a GPU
+    pin_memory = device.type == "cuda"
+
+    if IN_MEMORY:
+        dataloader = DeviceBatchLoader(
+            features_file=DATA_PATH,
+            batch_size=BATCH_SIZE,
+            device=device,
+            rank=rank,
+            world_size=world_size,
+        )
+    else:
+        dataloader = get_dataloader(
+            features_file=DATA_PATH,
+            batch_size=BATCH_SIZE,
+            pin_memory=pin_memory,
+            rank=rank,
+            world_size=world_size,
+        )
 
     # Calculate Total Steps for Scheduler
     total_steps = len(dataloader) * EPOCHS
@@ -69,7 +110,11 @@ def train():
     decay_steps = total_steps - warmup_steps
 
     # 2. Initialize Model
-    model = MovieFusionModel(output_dim=512).to(DEVICE)
+    model = MovieFusionModel(output_dim=512).to(device)
+    raw_model = model  # unwrapped, for state_dicts
+
+    if LOG_FUSION_METRICS:
+        raw_model.metrics = FusionMetrics()
 
     optimizer = optim.AdamW(model.parameters(), lr=LEARNING_RATE, weight_decay=1e-5)
 
@@ -87,7 +132,18 @@ def train():
         milestones=[warmup_steps]
     )
 
-    scaler = torch.amp.GradScaler('cuda')
+    # Mixed precision on whatever device we train on; loss scaling is only
+    # needed for fp16 (bf16 has the fp32 exponent range)
+    amp_dtype = AMP_DTYPES[PRECISION]
+    scaler = torch.amp.GradScaler(device.type, enabled=PRECISION == "fp16")
+
+    def autocast():
+        return torch.amp.autocast(device.type, dtype=amp_dtype, enabled=amp_dtype is not None)
+
+    queue = MemoryQueue(QUEUE_SIZE, model.output_dim, device=device) if QUEUE_SIZE else None
+    momentum_model = momentum_copy(model) if queue is not None and MOMENTUM is not None else None
+    if momentum_model is not None:
+        momentum_model.metrics = None  # deepcopy of raw_model.metrics, only the online model is logged
 
     # 3. Resume Logic
     start_epoch = 0
@@ -95,44 +151,79 @@ def train():
 
     if os.path.exists(checkpoint_path):
         print(f"Resuming from {checkpoint_path}")
-        checkpoint = torch.load(checkpoint_path)
+        checkpoint = torch.load(checkpoint_path, map_location=device)
         model.load_state_dict(checkpoint['model_state_dict'], strict=False)
         optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-        scaler.load_state_dict(checkpoint['scaler_state_dict'])
+        # checkpoints from before PRECISION existed were trained in fp16
+        if checkpoint.get('precision', 'fp16') == PRECISION:
+            scaler.load_state_dict(checkpoint['scaler_state_dict'])
+        else:
+            print(f"Checkpoint precision {checkpoint.get('precision', 'fp16')} differs from {PRECISION}, resetting scaler")
         scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
         start_epoch = checkpoint['epoch'] + 1
 
+        if queue is not None and 'queue_state_dict' in checkpoint:
+            queue.load_state_dict(checkpoint['queue_state_dict'])
+        if momentum_model is not None and 'momentum_state_dict' in checkpoint:
+            momentum_model.load_state_dict(checkpoint['momentum_state_dict'])
+
+    if world_size > 1:
+        model = DistributedDataParallel(model, device_ids=[device.index] if device.type == "cuda" else None)
+
+    if COMPILE:
+        model = torch.compile(model)
+
+    # background, atomic checkpoint writes (rank 0 only)
+    writer = AsyncCheckpointWriter(SAVE_DIR, keep_last=KEEP_CHECKPOINTS) if is_main else None
+
     model.train()
 
-    print(f"Starting training on {DEVICE}...")
+    print(f"Starting training on {device} (rank {rank}/{world_size})...")
 
     for epoch in range(start_epoch, EPOCHS):
+        set_epoch(dataloader, epoch)
+
         total_loss = 0
-        progress_bar = tqdm(dataloader, desc=f"Epoch {epoch + 1}/{EPOCHS}")
+        progress_bar = tqdm(dataloader, desc=f"Epoch {epoch + 1}/{EPOCHS}", disable=not is_main)
 
         for batch in progress_bar:
-            batch = {k: v.to(DEVICE, non_blocking=True) for k, v in batch.items()}
+            batch = {k: v.to(device, non_blocking=pin_memory) for k, v in batch.items()}
 
             optimizer.zero_grad(set_to_none=True)
 
-            # Create Views
+            # Create Views (same features, different masks)
             mask_v1 = batch['mask'].clone()
             mask_v1[:, 10:12] = 0 # zero out indicies 10-11 (in mask)
-            view1 = {**batch, 'mask': mask_v1}
 
             mask_v2 = batch['mask'].clone()
             mask_v2[:, 0:2] = 0 # zero out indicies 0-1 (in mask)
-            view2 = {**batch, 'mask': mask_v2}
 
-            with torch.amp.autocast('cuda'):
-                z1 = model(view1)
-                z2 = model(view2)
-                loss = contrastive_loss(z1, z2, temperature=TEMPERATURE)
+            with autocast():
+                # one projection pass shared by both views
+                z1, z2 = model(batch, view_masks=[mask_v1, mask_v2])
+
+                # global batch: every rank's embeddings are negatives
+                loss = contrastive_loss(
+                    all_gather(z1), all_gather(z2),
+                    temperature=TEMPERATURE,
+                    chunk_size=LOSS_CHUNK_SIZE,
+                    negatives=queue.negatives() if queue is not None else None
+                )
 
             scaler.scale(loss).backward()
             scaler.step(optimizer)
             scaler.update()
 
+            if queue is not None:
+                if momentum_model is not None:
+                    momentum_update(momentum_model, raw_model, MOMENTUM)
+                    with torch.no_grad(), autocast():
+                        keys = momentum_model({**batch, 'mask': mask_v2})
+                else:
+                    keys = z2
+                with torch.no_grad():
+                    queue.enqueue(all_gather(keys))
+
             # STEP SCHEDULER PER BATCH (Not per epoch)
             scheduler.step()
 
@@ -143,24 +234,45 @@ def train():
             progress_bar.set_postfix({'loss': loss.item(), 'lr': f"{current_lr:.2e}"})
 
         avg_loss = total_loss / len(dataloader)
+
+        # every rank holds the same weights, rank 0 writes them
+        if not is_main:
+            continue
+
         print(f"Epoch {epoch + 1} Done. Loss: {avg_loss:.4f}")
 
+        if raw_model.metrics is not None:
+            print(raw_model.metrics.format())
+            raw_model.metrics.reset()
+
         # Save Checkpoint
         checkpoint = {
             'epoch': epoch,
-            'model_state_dict': model.state_dict(),
+            'model_state_dict': raw_model.state_dict(),
             'optimizer_state_dict': optimizer.state_dict(),
             'scaler_state_dict': scaler.state_dict(),
             'scheduler_state_dict': scheduler.state_dict(),  # Save scheduler
             'loss': avg_loss,
+            'precision': PRECISION,
         }
-        torch.save(checkpoint, os.path.join(SAVE_DIR, "latest_checkpoint.pt"))
-
+        if queue is not None:
+            checkpoint['queue_state_dict'] = queue.state_dict()
+        if momentum_model is not None:
+            checkpoint['momentum_state_dict'] = momentum_model.state_dict()
         if (epoch + 1) % 10 == 0:
-            torch.save(checkpoint, os.path.join(SAVE_DIR, f"model_epoch_{epoch + 1}.pt"))
+            writer.save(checkpoint, "latest_checkpoint.pt", f"model_epoch_{epoch + 1}.pt")
+        else:
+            writer.save(checkpoint, "latest_checkpoint.pt")
+
+    if is_main:
+        writer.close()
+
+        atomic_save(raw_model.state_dict(), os.path.join(SAVE_DIR, f"../../data/model/fusion_model.pt"))
+        # exported inference graph for generate_embeddings / serving
+        export_model(raw_model, os.path.join(SAVE_DIR, "../../data/model/fusion_model.pt2"))
+        print("Training Complete.")
 
-    torch.save(model.state_dict(), os.path.join(SAVE_DIR, f"../../data/model/fusion_model.pt"))
-    print("Training Complete.")
+    cleanup_distributed()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+import time
+from contextlib import contextmanager
+
+import torch
+
+# Order of the modality axis in MovieFusionModel's [batch, 6, 256] stack
+MODALITIES = ['text', 'keywords', 'genres', 'poster', 'backdrop', 'meta']
+
+class FusionMetrics:
+    """
+    Optional instrumentation for MovieFusionModel (set model.metrics).
+    Accumulates, per modality, the mean attention weight and how often the
+    modality is present, plus wall time per forward stage. Sums stay on the
+    model's device until summary(), so recording does not sync every batch
+    (timings do, see timer).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rows = 0
+        self.attn_sum = None
+        self.present_sum = None
+        self.stage_seconds = {}
+        self.stage_calls = {}
+
+    @torch.no_grad()
+    def record(self, attn_weights, modality_mask):
+        """
+        Called once per batch with the unaugmented feature mask.
+
+        Args:
+            attn_weights: [batch, 6, 1] softmax weights under modality_mask
+            modality_mask: [batch, 6, 1] modality presence
+        """
+        attn = attn_weights.detach().float().sum(dim=(0, 2))
+        present = (modality_mask.detach() > 0).float().sum(dim=(0, 2))
+
+        if self.attn_sum is None:
+            self.attn_sum, self.present_sum = attn, present
+        else:
+            self.attn_sum += attn
+            self.present_sum += present
+        self.rows += attn_weights.shape[0]
+
+    @contextmanager
+    def timer(self, stage, device=None):
+        """
+        Times the enclosed block. CUDA work is asynchronous, so on a GPU
+        device the stream is synchronized on entry and exit.
+        """
+        sync = device is not None and device.type == "cuda"
+        if sync:
+            torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if sync:
+                torch.cuda.synchronize(device)
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - start
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+
+    def summary(self):
+        """
+        Returns:
+            dict with
+                attention: modality -> mean attention weight
+                coverage: modality -> fraction of rows where it is present
+                stage_ms: stage -> mean milliseconds per call
+        """
+        result = {'rows': self.rows, 'attention': {}, 'coverage': {}, 'stage_ms': {}}
+
+        if self.rows > 0:
+            attn = (self.attn_sum / self.rows).tolist()
+            coverage = (self.present_sum / self.rows).tolist()
+            result['attention'] = dict(zip(MODALITIES, attn))
+            result['coverage'] = dict(zip(MODALITIES, coverage))
+
+        for stage, seconds in self.stage_seconds.items():
+            result['stage_ms'][stage] = 1000 * seconds / self.stage_calls[stage]
+
+        return result
+
+    def format(self):
+        summary = self.summary()
+        lines = [f"{'modality':<10} {'attention':>10} {'coverage':>10}"]
+        for name in summary['attention']:
+            lines.append(f"{name:<10} {summary['attention'][name]:>10.4f} {summary['coverage'][name]:>10.2%}")
+        stages = ", ".join(f"{stage} {ms:.2f} ms" for stage, ms in summary['stage_ms'].items())
+        lines.append(f"per batch: {stages}")
+        return "\n".join(lines)
@@ -2,14 +2,28 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+# Metadata scalars in the order meta_proj expects them
+SCALAR_KEYS = ['year', 'month_sin', 'month_cos', 'vote_average', 'vote_count', 'popularity', 'runtime']
+
 class MovieFusionModel(nn.Module):
     """
     Multi-modal fusion model with attention mechanism
     Combines text, keywords, genres, images, and metadata into a single embedding
     """
-    def __init__(self, output_dim=512):
+    def __init__(self, output_dim=512, fused_projection=False):
+        """
+        Args:
+            output_dim: size of the final embedding
+            fused_projection: under no_grad, write every modality projection
+                straight into one preallocated [batch, 6, 256] buffer (see
+                _project_into). Same weights and state_dict either way.
+        """
         super().__init__()
         self.output_dim = output_dim
+        self.fused_projection = fused_projection
+
+        # optional FusionMetrics (models/fusion_metrics.py), off by default
+        self.metrics = None
 
         # Project all features to same dimension (256)
         self.text_proj = nn.Linear(768, 256)
@@ -34,21 +48,22 @@ class MovieFusionModel(nn.Module):
             nn.LayerNorm(output_dim)
         )
 
-    def forward(self, features):
+    def project(self, features):
         """
+        Projects every modality to 256-dim.
+
         Args:
-            features: dict with keys from features.pt
-                - text: [batch, 768]
-                - keywords: [batch, 300]
-                - genres: [batch, 19]
-                - poster_file: [batch, 512]
-                - backdrop_file: [batch, 512]
-                - year, month_sin, month_cos, vote_average, vote_count, popularity, runtime: [batch, 1]
-                - mask: [batch, 12]
+            features: dict with keys from features.pt (see forward)
 
         Returns:
-            embeddings: [batch, output_dim] L2-normalized embeddings
+            stack: [batch, 6 modalities, 256]
         """
+        scalars = torch.cat([features[key] for key in SCALAR_KEYS], dim=1)
+
+        if self.fused_projection and not torch.is_grad_enabled() \
+                and not torch.is_autocast_enabled(scalars.device.type):
+            return self._project_into(features, scalars)
+
         # Project all modalities to 256-dim
         emb_text = torch.tanh(self.text_proj(features['text']))
         emb_keywords = torch.tanh(self.keyword_proj(features['keywords']))
@@ -56,20 +71,10 @@ class MovieFusionModel(nn.Module):
         emb_poster = torch.tanh(self.poster_proj(features['poster_file']))
         emb_backdrop = torch.tanh(self.backdrop_proj(features['backdrop_file']))
 
-        # Combine scalar features
-        scalars = torch.cat([
-            features['year'],
-            features['month_sin'],
-            features['month_cos'],
-            features['vote_average'],
-            features['vote_count'],
-            features['popularity'],
-            features['runtime']
-        ], dim=1)
         emb_meta = torch.tanh(self.meta_proj(scalars))
 
         # Stack: [batch, 6 modalities, 256]
-        stack = torch.stack([
+        return torch.stack([
             emb_text,
             emb_keywords,
             emb_genres,
@@ -78,24 +83,70 @@ class MovieFusionModel(nn.Module):
             emb_meta
         ], dim=1)
 
-        modality_mask = torch.stack([
-            features['mask'][:, 0],   # text
-            features['mask'][:, 1],   # keywords
-            features['mask'][:, 2],   # genres
-            features['mask'][:, 10],  # poster
-            features['mask'][:, 11],  # backdrop
-            torch.all(features['mask'][:, 3:10] > 0, dim=1).float()  # meta (all scalars present)
-        ], dim=1).unsqueeze(-1)  # [batch, 6, 1]
+    def _project_into(self, features, scalars):
+        """
+        Inference-only version of project: each addmm writes its output
+        directly into its slot of the stack buffer and a single in-place
+        tanh covers all six, so there is no torch.stack copy and one
+        activation kernel instead of six. out= has no autograd support,
+        hence no_grad only.
+        """
+        inputs = [
+            (features['text'], self.text_proj),
+            (features['keywords'], self.keyword_proj),
+            (features['genres'], self.genre_proj),
+            (features['poster_file'], self.poster_proj),
+            (features['backdrop_file'], self.backdrop_proj),
+            (scalars, self.meta_proj)
+        ]
 
-        # Calculate attention scores
-        attn_scores = self.attention(stack)  # [batch, 6, 1]
+        stack = scalars.new_empty((scalars.shape[0], len(inputs), 256))
+        for i, (x, proj) in enumerate(inputs):
+            torch.addmm(proj.bias, x, proj.weight.t(), out=stack[:, i])
+
+        return stack.tanh_()
+
+    @staticmethod
+    def modality_mask(mask):
+        """
+        Maps the 12-column feature mask to one flag per modality.
+
+        Returns:
+            modality_mask: [batch, 6, 1]
+        """
+        return torch.stack([
+            mask[:, 0],   # text
+            mask[:, 1],   # keywords
+            mask[:, 2],   # genres
+            mask[:, 10],  # poster
+            mask[:, 11],  # backdrop
+            torch.all(mask[:, 3:10] > 0, dim=1).to(mask.dtype)  # meta (all scalars present)
+        ], dim=1).unsqueeze(-1)
 
-        # Mask out missing modalities (set to -inf so softmax makes them 0)
+    @staticmethod
+    def attention_weights(attn_scores, modality_mask):
+        """
+        Softmax of the attention scores over the modalities present in modality_mask.
+
+        Returns:
+            attn_weights: [batch, 6, 1]
+        """
+        # Mask out missing modalities (set to -inf so softmax makes them 0).
+        # Out of place: attn_scores is shared between views
         min_value = torch.finfo(attn_scores.dtype).min
-        attn_scores = attn_scores.masked_fill_(modality_mask == 0, min_value)
+        attn_scores = attn_scores.masked_fill(modality_mask == 0, min_value)
 
         # Normalize to get weights
-        attn_weights = F.softmax(attn_scores, dim=1)
+        return F.softmax(attn_scores, dim=1)
+
+    def fuse(self, stack, attn_scores, modality_mask):
+        """
+        Attention-weighted sum of the modality stack followed by the head.
+
+        Returns:
+            embeddings: [batch, output_dim] L2-normalized embeddings
+        """
+        attn_weights = self.attention_weights(attn_scores, modality_mask)
 
         # Weighted sum
         fused = (stack * attn_weights).sum(dim=1)  # [batch, 256]
@@ -105,3 +156,113 @@ class MovieFusionModel(nn.Module):
 
         # L2 normalize for cosine similarity
         return F.normalize(embedding, p=2, dim=1)
+
+    def forward_views(self, features, masks):
+        """
+        Embeds several views of the same batch that differ only in their
+        feature mask. The modality projections and attention scores are
+        computed once and shared by every view.
+
+        Args:
+            features: dict with keys from features.pt (see forward)
+            masks: list of [batch, 12] masks, one per view
+
+        Returns:
+            list of [batch, output_dim] L2-normalized embeddings, one per mask
+        """
+        if self.metrics is not None:
+            return self._forward_views_timed(features, masks)
+
+        stack = self.project(features)
+
+        # Calculate attention scores
+        attn_scores = self.attention(stack)  # [batch, 6, 1]
+
+        return [self.fuse(stack, attn_scores, self.modality_mask(mask)) for mask in masks]
+
+    def _record_metrics(self, features, attn_scores):
+        # once per batch with the real mask: coverage / attention should not
+        # count the modalities that augmented views zero out
+        modality_mask = self.modality_mask(features['mask'])
+        self.metrics.record(self.attention_weights(attn_scores, modality_mask), modality_mask)
+
+    def _forward_views_timed(self, features, masks):
+        # forward_views with per-stage timings into self.metrics
+        device = features['text'].device
+
+        with self.metrics.timer('projection', device):
+            stack = self.project(features)
+
+        with self.metrics.timer('attention', device):
+            attn_scores = self.attention(stack)
+
+        self._record_metrics(features, attn_scores)
+
+        with self.metrics.timer('head', device):
+            return [self.fuse(stack, attn_scores, self.modality_mask(mask)) for mask in masks]
+
+    def forward(self, features, view_masks=None):
+        """
+        Args:
+            features: dict with keys from features.pt
+                - text: [batch, 768]
+                - keywords: [batch, 300]
+                - genres: [batch, 19]
+                - poster_file: [batch, 512]
+                - backdrop_file: [batch, 512]
+                - year, month_sin, month_cos, vote_average, vote_count, popularity, runtime: [batch, 1]
+                - mask: [batch, 12]
+            view_masks: optional list of [batch, 12] masks, see forward_views
+
+        Returns:
+            embeddings: [batch, output_dim] L2-normalized embeddings,
+            or a list of them (one per view) when view_masks is given
+        """
+        # going through forward (not forward_views) keeps DDP's gradient hooks
+        if view_masks is not None:
+            return self.forward_views(features, view_masks)
+        return self.forward_views(features, [features['mask']])[0]
+
+def example_features(batch_size=2, device="cpu"):
+    """
+    Random batch in the features.pt layout, used as the tracing input for export.
+    """
+    features = {
+        'text': torch.randn(batch_size, 768, device=device),
+        'keywords': torch.randn(batch_size, 300, device=device),
+        'genres': torch.randn(batch_size, 19, device=device),
+        'poster_file': torch.randn(batch_size, 512, device=device),
+        'backdrop_file': torch.randn(batch_size, 512, device=device),
+        'mask': torch.ones(batch_size, 12, device=device)
+    }
+    for key in SCALAR_KEYS:
+        features[key] = torch.randn(batch_size, 1, device=device)
+    return features
+
+def export_model(model, path):
+    """
+    Saves the inference graph of model (eval mode, single view) with
+    torch.export, dynamic in the batch dimension. Load it with load_exported_model.
+    """
+    was_training = model.training
+    model.eval()
+
+    device = next(model.parameters()).device
+    features = example_features(device=device)
+    batch = torch.export.Dim("batch")
+
+    exported = torch.export.export(
+        model,
+        (features,),
+        dynamic_shapes=({key: {0: batch} for key in features},)
+    )
+    torch.export.save(exported, path)
+
+    model.train(was_training)
+
+def load_exported_model(path, device):
+    """
+    Returns:
+        callable module taking a features dict, like MovieFusionModel.forward
+    """
+    return torch.export.load(path).module().to(device)
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import torch
+import torch.nn as nn
+
+# bump when preprocessing in front of the encoders changes (clean_text, IMAGE_TRANSFORM, ...)
+CACHE_VERSION = 1
+
+def text_digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def file_digests(paths: Sequence[str], num_threads: int = 8) -> List[str]:
+    """
+    Hashes image files on a thread pool, hashlib releases the GIL while hashing.
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        return list(pool.map(file_digest, paths))
+
+def encoder_fingerprint(encoder: nn.Module) -> str:
+    """
+    Identifies an encoder by class name and a digest of its weights, so
+    e.g. a re-initialised projection layer never reuses stale embeddings.
+    """
+    digest = hashlib.sha1(f"{type(encoder).__name__}:v{CACHE_VERSION}".encode())
+    for name, tensor in encoder.state_dict().items():
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return f"{type(encoder).__name__}:{digest.hexdigest()}"
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (encoder fingerprint, hash of the input
+    text or image bytes), stored in a single sqlite file. Least recently used
+    entries are evicted once the stored embeddings exceed max_bytes.
+    """
+    def __init__(self, path: str, max_bytes: int = 16 * 1024 ** 3):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+
+        self.max_bytes = max_bytes
+        self.size, last_used = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM embeddings"
+        ).fetchone()
+        self._clock = last_used + 1
+
+        self._fingerprints = {}
+        self.hits = 0
+        self.misses = 0
+
+    def encoder_key(self, encoder: nn.Module) -> str:
+        if id(encoder) not in self._fingerprints:
+            self._fingerprints[id(encoder)] = encoder_fingerprint(encoder)
+        return self._fingerprints[id(encoder)]
+
+    @staticmethod
+    def key(encoder_key: str, digest: str) -> str:
+        return hashlib.sha1(f"{encoder_key}:{digest}".encode()).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[torch.Tensor]]:
+        """
+        Returns the cached embedding for every key, None on a miss.
+        """
+        found = {}
+        for start in range(0, len(keys), 500):  # sqlite caps bound parameters
+            chunk = list(keys[start:start + 500])
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, value FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+
+            for key, value in rows:
+                found[key] = torch.frombuffer(bytearray(value), dtype=torch.float32)
+
+            if rows:
+                self.conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})",
+                    [self._clock, *chunk]
+                )
+        self.conn.commit()
+        self._clock += 1
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        return [found.get(key) for key in keys]
+
+    def put_many(self, keys: Sequence[str], values: torch.Tensor):
+        """
+        Stores one embedding row per key, evicting old entries if needed.
+        """
+        values = values.detach().to("cpu", torch.float32).contiguous()
+
+        rows = [(key, row.numpy().tobytes(), row.numel() * 4, self._clock) for key, row in zip(keys, values)]
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (key, value, size, last_used) VALUES (?, ?, ?, ?)", rows
+        )
+        if rows:
+            self.size += (self.conn.total_changes - before) * rows[0][2]
+        self.conn.commit()
+        self._clock += 1
+
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            oldest = self.conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not oldest:
+                break
+
+            evicted = []
+            for key, size in oldest:
+                if self.size <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                self.size -= size
+
+            self.conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -3,44 +3,51 @@ import torch
 import torch.nn.functional as F
 from tqdm import tqdm
 
-from ml.src.models.fusion_model import MovieFusionModel
+from ml.src.models.fusion_metrics import FusionMetrics
+from ml.src.models.fusion_model import MovieFusionModel, load_exported_model
+from ml.src.utils.feature_store import load_features
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, "../.."))
 DIR = os.path.join(PROJECT_ROOT, "data", "processed")
+FEATURES_PATH = os.path.join(DIR, "features")  # feature store, falls back to a legacy features.pt
 
-def generate_embeddings_learned(model_path="model/fusion_model.pt", batch_size=256):
-    """
-    Generate embeddings using trained fusion model
-
-    Args:
-        model_path: Path to trained model checkpoint
-        batch_size: Number of movies to process at once
-    """
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+def _load_model(model_path, device, exported_path=None, log_metrics=False):
+    # graph saved by contrastive_train via torch.export, skips the Python forward
+    if exported_path:
+        return load_exported_model(os.path.join(DIR, '..', exported_path), device)
 
-    features = torch.load(os.path.join(DIR, 'features.pt'))
-    num_movies = features['text'].shape[0]
-
-    model = MovieFusionModel(output_dim=512).to(device)
-
-    # Load trained weights if available
-    if not model_path and (not os.path.exists(model_path)):
-        print('provide model')
-        return None
+    model = MovieFusionModel(output_dim=512, fused_projection=True).to(device)
 
     checkpoint = torch.load(os.path.join(DIR, '..' ,model_path), map_location=device)
     model.load_state_dict(checkpoint['model_state_dict'])
 
+    # attention / coverage / timings, printed after _embed
+    if log_metrics:
+        model.metrics = FusionMetrics()
+
     model.eval()
+    return model
+
+def _embed(model, features, indices, batch_size, device):
+    """
+    Runs the fusion model over features rows (all rows when indices is None).
+
+    Returns:
+        fused: [num_rows, 512], text_only: [num_rows, 768]
+    """
+    num_rows = features['text'].shape[0] if indices is None else len(indices)
 
-    # Generate embedding
     all_embeddings = []
     text_only_embeddings = []
 
     with torch.no_grad():
-        for i in tqdm(range(0, num_movies, batch_size), desc="Processing batches"):
-            batch = {k: v[i:i+batch_size].to(device) for k, v in features.items()}
+        for i in tqdm(range(0, num_rows, batch_size), desc="Processing batches"):
+            if indices is None:
+                batch = {k: v[i:i+batch_size].to(device) for k, v in features.items()}
+            else:
+                rows = indices[i:i+batch_size]
+                batch = {k: v[rows].to(device) for k, v in features.items()}
 
             # Fused embeddings
             fused = model(batch)
@@ -50,8 +57,35 @@ def generate_embeddings_learned(model_path="model/fusion_model.pt", batch_size=2
             text_only = F.normalize(batch['text'], p=2, dim=1)
             text_only_embeddings.append(text_only.cpu())
 
-    fused_embeddings = torch.cat(all_embeddings, dim=0)
-    text_embeddings = torch.cat(text_only_embeddings, dim=0)
+    metrics = getattr(model, 'metrics', None)
+    if metrics is not None:
+        print(metrics.format())
+
+    return torch.cat(all_embeddings, dim=0), torch.cat(text_only_embeddings, dim=0)
+
+def generate_embeddings_learned(model_path="model/fusion_model.pt", batch_size=256, exported_path=None, log_metrics=False):
+    """
+    Generate embeddings using trained fusion model
+
+    Args:
+        model_path: Path to trained model checkpoint
+        batch_size: Number of movies to process at once
+        exported_path: optional exported graph (e.g. model/fusion_model.pt2) used instead of model_path
+        log_metrics: collect and print fusion metrics (eager model only, adds per-batch syncs)
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    features = load_features(FEATURES_PATH)
+
+    # Load trained weights if available
+    if not model_path and (not os.path.exists(model_path)):
+        print('provide model')
+        return None
+
+    model = _load_model(model_path, device, exported_path, log_metrics)
+
+    # Generate embedding
+    fused_embeddings, text_embeddings = _embed(model, features, None, batch_size, device)
 
     # Save embeddings
     embeddings_dict = {
@@ -64,6 +98,49 @@ def generate_embeddings_learned(model_path="model/fusion_model.pt", batch_size=2
 
     return embeddings_dict
 
+def update_embeddings(indices, model_path="model/fusion_model.pt", batch_size=256, exported_path=None, log_metrics=False):
+    """
+    Recomputes embeddings.pt rows for the given feature indices only.
+    Indices past the end of the current embeddings (newly added movies)
+    grow both tensors.
+
+    Args:
+        indices: feature rows that were added or changed
+        model_path: Path to trained model checkpoint
+        batch_size: Number of movies to process at once
+        exported_path: optional exported graph used instead of model_path
+        log_metrics: collect and print fusion metrics
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    save_path = os.path.join(DIR, 'embeddings.pt')
+    if not os.path.exists(save_path):
+        return generate_embeddings_learned(model_path, batch_size, exported_path, log_metrics)
+
+    features = load_features(FEATURES_PATH)
+    embeddings_dict = torch.load(save_path)
+
+    num_movies = features['text'].shape[0]
+    indices = torch.as_tensor(sorted(set(indices)), dtype=torch.long)
+
+    for key in ('fused', 'text_only'):
+        current = embeddings_dict[key]
+        if current.shape[0] < num_movies:
+            grown = torch.zeros((num_movies, current.shape[1]), dtype=current.dtype)
+            grown[:current.shape[0]] = current
+            embeddings_dict[key] = grown
+
+    if len(indices) > 0:
+        model = _load_model(model_path, device, exported_path, log_metrics)
+        fused, text_only = _embed(model, features, indices, batch_size, device)
+
+        embeddings_dict['fused'][indices] = fused
+        embeddings_dict['text_only'][indices] = text_only
+
+    torch.save(embeddings_dict, save_path)
+
+    return embeddings_dict
+
 
 if __name__ == '__main__':
-    generate_embeddings_learned()
\ No newline at end of file
+    generate_embeddings_learned()
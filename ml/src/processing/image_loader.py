@@ -0,0 +1,70 @@
+import os
+from typing import Optional, Sequence
+
+import pandas as pd
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+from torchvision import transforms
+from torchvision.transforms import InterpolationMode
+
+IMAGE_SIZE = 224
+
+IMAGE_TRANSFORM = transforms.Compose([
+    transforms.RandomCrop((280, 280), pad_if_needed=True),
+    transforms.Resize(IMAGE_SIZE, interpolation=InterpolationMode.BILINEAR),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406],
+                         [0.229, 0.224, 0.225])
+])
+
+def has_image(path) -> bool:
+    if pd.isna(path) or not path:
+        return False
+    return os.path.exists(path)
+
+def load_image(path) -> Optional[torch.Tensor]:
+    """
+    Opens an image file and applies IMAGE_TRANSFORM, shape [3, 224, 224].
+    """
+    if not has_image(path):
+        return None
+
+    img = Image.open(path).convert("RGB")
+    return IMAGE_TRANSFORM(img)
+
+class ImagePathDataset(Dataset):
+    """
+    Decodes and transforms poster/backdrop files so the work can run in
+    DataLoader worker processes while the CNN encodes the previous batch.
+
+    Files that fail to decode come back as a zero image with loaded=False.
+    """
+    def __init__(self, paths: Sequence[str]):
+        self.paths = list(paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx: int):
+        try:
+            img = load_image(self.paths[idx])
+        except OSError:
+            img = None
+
+        if img is None:
+            return torch.zeros((3, IMAGE_SIZE, IMAGE_SIZE), dtype=torch.float32), False
+
+        return img, True
+
+def get_image_dataloader(paths, batch_size=64, num_workers=4, pin_memory=False, prefetch_factor=4):
+    ds = ImagePathDataset(paths)
+
+    return DataLoader(
+            ds,
+            batch_size=batch_size,
+            shuffle=False,
+            num_workers=num_workers,
+            pin_memory=pin_memory,
+            prefetch_factor=prefetch_factor if num_workers > 0 else None
+        )
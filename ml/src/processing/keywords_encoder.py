@@ -1,25 +1,144 @@
 import os
+import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import re
-from torchtext.vocab import GloVe
+from functools import lru_cache
+from typing import Iterable, Optional, Sequence, Tuple
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, "..", ".."))
 
+# written by scripts/build_keyword_vocab.py
+SUBSET_DIR = os.path.join(PROJECT_ROOT, "data", "cache", "glove_subset")
+
+PHRASE_CACHE_SIZE = 1 << 18  # distinct keyword phrases memoized per WordEmbedding
+
+_PARENS_RE = re.compile(r"\(.*?\)")
+_PUNCT_RE = re.compile(r"[^\w\s]")  # keep letters, numbers, underscores, spaces
+
+@lru_cache(maxsize=PHRASE_CACHE_SIZE)
+def tokenize_phrase(kw: str) -> Tuple[str, ...]:
+    """
+    Lowercase words of a single keyword phrase, e.g. "based on novel or book".
+    Memoized since the same phrases repeat across many movies.
+    """
+    kw = kw.strip().lower()
+
+    # Remove anything in parentheses
+    kw = _PARENS_RE.sub("", kw)
+
+    # Remove punctuation
+    kw = _PUNCT_RE.sub("", kw)
+
+    # Split multi-word phrases into individual words
+    return tuple(kw.split())
+
+def tokenize_keywords(x) -> list:
+    """
+    Splits a comma separated keyword string into lowercase words,
+    without checking them against a vocabulary.
+    """
+    if not x or str(x).strip().lower() == "nan":
+        return []
+
+    tokens = []
+    for kw in x.split(","):
+        tokens.extend(tokenize_phrase(kw))
+
+    return tokens
+
 class WordEmbedding:
-    def __init__(self, name: str = '840B', dim: int = 300):
+    def __init__(self, name: str = '840B', dim: int = 300, subset_dir: Optional[str] = SUBSET_DIR):
         """
         Initializes the GloVe model and creates a PyTorch embedding layer.
+
+        If subset_dir holds a vocabulary subset (see save_subset) it is
+        memory-mapped instead of loading the full GloVe table.
         """
-        cache_dir = os.path.join(PROJECT_ROOT, "data", "cache")
+        self.is_subset = subset_dir is not None and os.path.exists(os.path.join(subset_dir, "vectors.npy"))
+        self.name, self.dim, self.subset_dir = name, dim, subset_dir
 
-        self.glove = GloVe(name=name, dim=dim, cache=cache_dir)
+        # words already checked against the full table and not in GloVe
+        self.oov = set()
+
+        if self.is_subset:
+            with open(os.path.join(subset_dir, "vocab.txt"), encoding="utf-8") as f:
+                itos = f.read().split("\n")
+
+            if os.path.exists(os.path.join(subset_dir, "oov.txt")):
+                with open(os.path.join(subset_dir, "oov.txt"), encoding="utf-8") as f:
+                    self.oov = set(f.read().split("\n"))
+
+            # copy-on-write mapping: pages are shared with other processes until written
+            weights = torch.from_numpy(np.load(os.path.join(subset_dir, "vectors.npy"), mmap_mode="c"))
+            self.stoi = {word: i for i, word in enumerate(itos)}
+        else:
+            from torchtext.vocab import GloVe
+
+            cache_dir = os.path.join(PROJECT_ROOT, "data", "cache")
+
+            self.glove = GloVe(name=name, dim=dim, cache=cache_dir)
+
+            weights = self.glove.vectors  # [vocab_size, embedding_dim]
+            self.stoi = self.glove.stoi
 
-        weights = self.glove.vectors  # [vocab_size, embedding_dim]
         self.embedding_layer = nn.Embedding.from_pretrained(weights)
 
-        self.stoi = self.glove.stoi
+        # raw keyword phrase -> in-vocabulary words, bound to this vocabulary
+        self.phrase_tokens = lru_cache(maxsize=PHRASE_CACHE_SIZE)(self._phrase_tokens)
+
+    def _phrase_tokens(self, kw: str) -> Tuple[str, ...]:
+        return tuple(w for w in tokenize_phrase(kw) if w in self.stoi)
+
+    def save_subset(self, words: Iterable[str], subset_dir: str = SUBSET_DIR):
+        """
+        Saves the vectors of the given in-vocabulary words as vocab.txt plus
+        a float32 vectors.npy that WordEmbedding(subset_dir=...) can load.
+        The remaining words go to oov.txt, so missing_tokens can tell words
+        GloVe doesn't know from words the subset has never seen.
+        """
+        words = set(words)
+        itos = sorted(w for w in words if w in self.stoi)
+        oov = sorted(w for w in words if w not in self.stoi)
+        weights = self.embedding_layer.weight[[self.stoi[w] for w in itos]]
+
+        os.makedirs(subset_dir, exist_ok=True)
+        np.save(os.path.join(subset_dir, "vectors.npy"), weights.detach().cpu().numpy().astype(np.float32))
+        with open(os.path.join(subset_dir, "oov.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(oov))
+        # vocab.txt last: it is what marks the subset as usable
+        with open(os.path.join(subset_dir, "vocab.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(itos))
+
+        return itos
+
+    def missing_tokens(self, keywords_raw: Iterable[str]) -> set:
+        """
+        Tokens of the given keyword strings that a subset was not built with
+        (neither in its vocabulary nor known to be out of GloVe). Non-empty
+        means the subset is stale for these movies; always empty for the
+        full table.
+        """
+        if not self.is_subset:
+            return set()
+
+        tokens = set()
+        for x in keywords_raw:
+            if isinstance(x, str):
+                tokens.update(tokenize_keywords(x))
+
+        return {w for w in tokens if w not in self.stoi and w not in self.oov}
+
+    def extend_subset(self, tokens: Iterable[str]) -> "WordEmbedding":
+        """
+        Rebuilds the subset with tokens added, loading the full GloVe table
+        once, and returns a WordEmbedding on the new subset.
+        """
+        full = WordEmbedding(name=self.name, dim=self.dim, subset_dir=None)
+        full.save_subset(set(self.stoi) | self.oov | set(tokens), self.subset_dir)
+        return WordEmbedding(name=self.name, dim=self.dim, subset_dir=self.subset_dir)
 
     def get_embedding(self, word: str) -> torch.Tensor:
         """
@@ -31,6 +150,36 @@ class WordEmbedding:
         word_index = torch.LongTensor([self.stoi[word]])
         return self.embedding_layer(word_index)
 
+    def encode_batch(self, keywords_raw: Sequence[str]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Mean-pools the keyword embeddings of many movies with a single
+        embedding_bag call instead of one lookup per word.
+
+        Args:
+            keywords_raw: one comma separated keyword string per movie (NaN/None allowed)
+
+        Returns:
+            embeddings: [num_movies, dim], zeros where no keyword is in the vocabulary
+            present: BoolTensor [num_movies]
+        """
+        indices = []
+        offsets = []
+        for x in keywords_raw:
+            offsets.append(len(indices))
+            if isinstance(x, str):
+                indices.extend(self.stoi[word] for word in self.split_keywords(x))
+
+        counts = torch.diff(torch.tensor(offsets + [len(indices)], dtype=torch.long))
+
+        embeddings = F.embedding_bag(
+            torch.tensor(indices, dtype=torch.long),
+            self.embedding_layer.weight,
+            torch.tensor(offsets, dtype=torch.long),
+            mode='mean'
+        )  # empty bags come back as zeros
+
+        return embeddings, counts > 0
+
     def split_keywords(self, x):
         """
         Splits strings of keywords into words, also singular words.
@@ -40,22 +189,7 @@ class WordEmbedding:
 
         keywords = []
         for kw in x.split(","):
-            kw = kw.strip().lower()
-            if not kw:
-                continue
-
-            # Remove anything in parentheses
-            kw = re.sub(r"\(.*?\)", "", kw)
-
-            # Remove punctuation
-            kw = re.sub(r"[^\w\s]", "", kw)  # keep letters, numbers, underscores, spaces
-
-            # Split multi-word phrases into individual words
-            words = kw.split()
-
-            words = [w.strip() for w in words if w.strip() in self.stoi]
-
-            keywords.extend(words)
+            keywords.extend(self.phrase_tokens(kw))
 
         return keywords
 
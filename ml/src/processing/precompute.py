@@ -0,0 +1,509 @@
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+import torch
+from tqdm import tqdm
+
+from ml.src.processing.embedding_cache import EmbeddingCache, file_digests, text_digest
+from ml.src.processing.image_loader import get_image_dataloader, has_image, load_image
+from ml.src.processing.keywords_encoder import WordEmbedding
+
+FEATURE_IDX = {
+    "text": 0,
+    "keywords": 1,
+    "genres": 2,
+    "year": 3,
+    "month_sin": 4,
+    "month_cos": 5,
+    "vote_average": 6,
+    "vote_count": 7,
+    "popularity": 8,
+    "runtime": 9,
+    "poster": 10,
+    "backdrop": 11
+}
+
+ALL_GENRES = [
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama',
+    'Family', 'Fantasy', 'History', 'Horror', 'Music', 'Mystery', 'Romance',
+    'Science Fiction', 'TV Movie', 'Thriller', 'War', 'Western'
+]
+
+GENRE_IDX = {genre: i for i, genre in enumerate(ALL_GENRES)}
+
+# features.pt key -> column in the processed movie rows
+SCALAR_COLUMNS = {
+    "year": "release_year",
+    "month_sin": "month_sin",
+    "month_cos": "month_cos",
+    "vote_average": "vote_average",
+    "vote_count": "vote_count",
+    "popularity": "popularity",
+    "runtime": "runtime",
+}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_DUPLICATE_PUNCTUATION = [
+    (re.compile(r"[.]{2,}"), "."),
+    (re.compile(r"[,]{2,}"), ","),
+    (re.compile(r"[!]{2,}"), "!"),
+    (re.compile(r"[?]{2,}"), "?"),
+]
+TEXT_COLUMNS = ["title", "tagline", "overview"]
+
+def clean_text(x):
+    # 1. Handle missing or nan
+    if pd.isna(x) or not x or str(x).lower() == "nan":
+        return ""
+
+    text = str(x)
+
+    # 2. Remove weird whitespace and 3. collapse multiple spaces
+    text = _WHITESPACE_RE.sub(" ", text)
+
+    # 4. Remove duplicate punctuation
+    for pattern, replacement in _DUPLICATE_PUNCTUATION:
+        text = pattern.sub(replacement, text)
+
+    # 5. Strip leading/trailing spaces & punctuation
+    return text.strip().strip(".")
+
+def clean_text_column(column: pd.Series) -> pd.Series:
+    """
+    clean_text over a whole pandas column using vectorized string ops,
+    missing values become "".
+    """
+    text = column.astype("string")
+    text = text.mask(text.str.lower() == "nan")
+
+    text = text.str.replace(_WHITESPACE_RE, " ", regex=True)
+    for pattern, replacement in _DUPLICATE_PUNCTUATION:
+        text = text.str.replace(pattern, replacement, regex=True)
+
+    return text.str.strip().str.strip(".").fillna("")
+
+def _join_text(parts) -> Optional[str]:
+    text = " ".join(f"{part}." for part in parts if part)
+    return text or None
+
+def build_text(movie_item) -> Optional[str]:
+    """
+    Joins title, tagline and overview into the sentence fed to sbert.
+    """
+    return _join_text(clean_text(movie_item.get(column)) for column in TEXT_COLUMNS)
+
+def build_texts(movies: List[dict]) -> List[Optional[str]]:
+    """
+    build_text for many movies, cleaning each text column in bulk.
+    """
+    frame = pd.DataFrame({column: [movie.get(column) for movie in movies] for column in TEXT_COLUMNS}, dtype=object)
+    cleaned = [clean_text_column(frame[column]).tolist() for column in TEXT_COLUMNS]
+
+    return [_join_text(parts) for parts in zip(*cleaned)]
+
+def get_text_features(movie_item, sbert_encoder) -> Optional[torch.Tensor]:
+    text = build_text(movie_item)
+
+    if text is None:
+        return None
+
+    with torch.no_grad():
+        embedding = sbert_encoder(text)  # if its empty sbert will just give it a default encoding
+    return embedding.cpu()
+
+def precompute_keywords(movie_item, words : WordEmbedding) -> Optional[torch.Tensor]:
+    keywords_raw = movie_item.get("keywords")
+
+    # Check for NaN before passing to split_keywords
+    if pd.isna(keywords_raw) or not keywords_raw:
+        return None
+
+    keywords = words.split_keywords(keywords_raw) # makes sure keywords are in glove 840b.300d
+
+    if not keywords:
+        return None
+
+    embeddings = [words.get_embedding(keyword) for keyword in keywords]
+
+    if not embeddings:
+        return None
+
+    embeddings_tensor = torch.vstack(embeddings)  # shape: [len(words), 300]
+    pooled_embedding = embeddings_tensor.mean(dim=0)  # shape: [300]
+    return pooled_embedding
+
+def one_hot_encode_genres(movie_item) -> Optional[torch.Tensor]:
+    movie_genres = movie_item.get('genres')
+
+    if pd.isna(movie_genres) or not movie_genres:
+        return None
+
+    movie_genres = [g.strip() for g in movie_genres.split(',') if g.strip()]
+
+    movie_genre_features = torch.zeros(len(GENRE_IDX), dtype=torch.float32)
+    for g in movie_genres:
+        if g in GENRE_IDX:
+            movie_genre_features[GENRE_IDX[g]] = 1.0
+
+    if movie_genre_features.sum() == 0:
+        return None
+
+    return movie_genre_features
+
+def precompute_images(img_encoder, path) -> Optional[torch.Tensor]:
+    img_tensor = load_image(path)
+
+    if img_tensor is None:
+        return None
+
+    img_tensor = img_tensor.unsqueeze(0).to(next(img_encoder.parameters()).device)
+
+    with torch.no_grad():
+        poster_embed = img_encoder.forward(img_tensor).squeeze(0)
+
+    return poster_embed.cpu()
+
+# tmdb_id -> content_hash at encode time, written next to the feature store
+CONTENT_HASHES_FILE = "content_hashes.pkl"
+
+def content_hash(movie_item) -> str:
+    """
+    Digest of everything that goes through the text, keyword and image
+    encoders, used to find the movies that need re-encoding on a refresh.
+    Images are identified by their TMDB path plus the local file's path,
+    size and modification time.
+
+    Compare against the hash stored when the features were encoded
+    (CONTENT_HASHES_FILE), not against a hash of the old row: both rows
+    point at the same local file, which is only stat'ed now.
+    """
+    digest = hashlib.sha1()
+
+    for value in (build_text(movie_item), movie_item.get("keywords")):
+        digest.update(str(value).encode())
+        digest.update(b"\0")
+
+    for column, tmdb_column in (("poster_file", "poster_path"), ("backdrop_file", "backdrop_path")):
+        path = movie_item.get(column)
+        digest.update(f"{movie_item.get(tmdb_column)}:{path}".encode())
+        if has_image(path):
+            stat = os.stat(path)
+            digest.update(f":{stat.st_size}:{stat.st_mtime_ns}".encode())
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+def shard_inputs_digest(movies: List[dict], encoder_keys: Sequence[str], hashes: Optional[Sequence[str]] = None) -> str:
+    """
+    Digest of everything a shard's features are computed from: the encoded
+    content (content_hash) and the genres/scalars of every movie, plus the
+    encoder fingerprints and dims. 03_feature_eng refits its scalers on
+    every run, so the scalars are part of it too.
+
+    Args:
+        hashes: content_hash of every movie if already computed
+    """
+    digest = hashlib.sha1()
+
+    for key in encoder_keys:
+        digest.update(str(key).encode())
+        digest.update(b"\0")
+
+    if hashes is None:
+        hashes = [content_hash(movie) for movie in movies]
+
+    for movie, movie_hash in zip(movies, hashes):
+        digest.update(movie_hash.encode())
+        for column in ("genres", *SCALAR_COLUMNS.values()):
+            digest.update(f":{movie.get(column)}".encode())
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+def _set(features_array, mask_array, index, feature_idx, value):
+    """
+    Assign a value to a feature array and update the mask.
+    """
+    if value is not None:
+        features_array[index] = value
+        mask_array[index, feature_idx] = 1.0
+    else:
+        mask_array[index, feature_idx] = 0.0
+
+def _set_batch(features_array, mask_array, indices, feature_idx, values, present):
+    """
+    Batched _set: values holds one row per True entry in present.
+
+    Args:
+        indices: LongTensor [n] of rows in the feature arrays
+        values: Tensor [present.sum(), dim] or None when nothing is present
+        present: BoolTensor [n]
+    """
+    if values is not None and present.any():
+        features_array[indices[present]] = values
+    mask_array[indices, feature_idx] = present.float()
+
+def to_tensor_or_none(value) -> Optional[torch.Tensor]:
+    if pd.isna(value):
+        return None
+    return torch.tensor([value], dtype=torch.float32)
+
+def allocate_features(num_movies: int, text_dim: int, image_dim: int) -> Dict[str, torch.Tensor]:
+    """
+    Preallocates the zero-filled tensors of the feature store layout.
+    """
+    features = {
+        "text": torch.zeros((num_movies, text_dim), dtype=torch.float32),
+        "keywords": torch.zeros((num_movies, 300), dtype=torch.float32),
+        "genres": torch.zeros((num_movies, len(ALL_GENRES)), dtype=torch.float32),
+    }
+    for key in SCALAR_COLUMNS:
+        features[key] = torch.zeros((num_movies, 1), dtype=torch.float32)
+    features["poster_file"] = torch.zeros((num_movies, image_dim), dtype=torch.float32)
+    features["backdrop_file"] = torch.zeros((num_movies, image_dim), dtype=torch.float32)
+    features["mask"] = torch.zeros((num_movies, len(FEATURE_IDX)), dtype=torch.float32)
+    return features
+
+def encode_texts(
+        texts: Sequence[str],
+        sbert_encoder,
+        batch_size: int = 64,
+        cache: Optional[EmbeddingCache] = None
+) -> torch.Tensor:
+    """
+    Encodes a list of texts with a single SentenceTransformer.encode call.
+    With a cache, only texts not seen before by this encoder are encoded.
+
+    Returns:
+        Tensor [len(texts), sbert_encoder.output_dim] on cpu
+    """
+    texts = list(texts)
+
+    if cache is None:
+        with torch.no_grad():
+            embeddings = sbert_encoder(texts, batch_size=batch_size)
+        return embeddings.cpu()
+
+    encoder_key = cache.encoder_key(sbert_encoder)
+    keys = [cache.key(encoder_key, text_digest(text)) for text in texts]
+    embeddings = cache.get_many(keys)
+
+    todo = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if todo:
+        with torch.no_grad():
+            encoded = sbert_encoder([texts[i] for i in todo], batch_size=batch_size).cpu()
+        cache.put_many([keys[i] for i in todo], encoded)
+
+        for i, embedding in zip(todo, encoded):
+            embeddings[i] = embedding
+
+    return torch.stack(embeddings)
+
+def encode_images(
+        img_encoder,
+        paths: Sequence,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        progress: bool = False,
+        cache: Optional[EmbeddingCache] = None
+) -> Tuple[Optional[torch.Tensor], torch.Tensor]:
+    """
+    Encodes image files in stacked batches. Decoding and transforms run in
+    num_workers DataLoader processes so the CNN does not wait on PIL.
+    With a cache, files whose bytes were already encoded are not decoded.
+
+    Returns:
+        embeddings: Tensor [num_present, output_dim] or None if no image loaded
+        present: BoolTensor [len(paths)], True where the image could be loaded
+    """
+    device = next(img_encoder.parameters()).device
+
+    present = torch.zeros(len(paths), dtype=torch.bool)
+    positions = [i for i, path in enumerate(paths) if has_image(path)]
+
+    if not positions:
+        return None, present
+
+    embeddings = [None] * len(positions)
+    keys = None
+    if cache is not None:
+        encoder_key = cache.encoder_key(img_encoder)
+        keys = [cache.key(encoder_key, digest) for digest in file_digests([paths[i] for i in positions])]
+        embeddings = cache.get_many(keys)
+
+    todo = [j for j, embedding in enumerate(embeddings) if embedding is None]
+
+    loader = []
+    if todo:
+        loader = get_image_dataloader(
+            [paths[positions[j]] for j in todo],
+            batch_size=batch_size,
+            num_workers=num_workers,
+            pin_memory=device.type == "cuda"
+        )
+
+    offset = 0
+    for images, loaded in tqdm(loader, desc="Encoding images", disable=not progress):
+        batch_todo = todo[offset:offset + len(loaded)]
+        offset += len(loaded)
+
+        if not loaded.any():
+            continue
+
+        with torch.no_grad():
+            encoded = img_encoder(images[loaded].to(device, non_blocking=True)).cpu()
+
+        loaded_todo = [j for j, ok in zip(batch_todo, loaded.tolist()) if ok]
+        for j, embedding in zip(loaded_todo, encoded):
+            embeddings[j] = embedding
+
+        if cache is not None:
+            cache.put_many([keys[j] for j in loaded_todo], encoded)
+
+    values = []
+    for j, embedding in enumerate(embeddings):
+        if embedding is not None:
+            present[positions[j]] = True
+            values.append(embedding)
+
+    if not values:
+        return None, present
+
+    return torch.stack(values), present
+
+def precompute_metadata(movies: List[dict], indices: Sequence[int], features: Dict[str, torch.Tensor]):
+    """
+    Writes genres and the scalar features (no encoders involved).
+    """
+    mask = features["mask"]
+
+    for movie, idx in zip(movies, torch.as_tensor(indices, dtype=torch.long).tolist()):
+        _set(features["genres"], mask, idx, FEATURE_IDX["genres"], one_hot_encode_genres(movie))
+
+        for key, column in SCALAR_COLUMNS.items():
+            _set(features[key], mask, idx, FEATURE_IDX[key], to_tensor_or_none(movie.get(column)))
+
+def precompute_image_features(
+        movies: List[dict],
+        indices: Sequence[int],
+        features: Dict[str, torch.Tensor],
+        img_encoder,
+        batch_size: int = 32,
+        num_workers: int = 0,
+        progress: bool = False,
+        cache: Optional[EmbeddingCache] = None
+):
+    """
+    Encodes posters and backdrops of the given movies through a single
+    image DataLoader and writes them into features at the given indices.
+    """
+    indices = torch.as_tensor(indices, dtype=torch.long)
+    num = len(movies)
+
+    # posters first, then backdrops, so one loader keeps the workers busy
+    paths = [movie.get("poster_file") for movie in movies] + [movie.get("backdrop_file") for movie in movies]
+    values, present = encode_images(img_encoder, paths, batch_size, num_workers, progress, cache)
+
+    num_posters = int(present[:num].sum())
+    poster_values = values[:num_posters] if values is not None else None
+    backdrop_values = values[num_posters:] if values is not None else None
+
+    _set_batch(features["poster_file"], features["mask"], indices, FEATURE_IDX["poster"], poster_values, present[:num])
+    _set_batch(features["backdrop_file"], features["mask"], indices, FEATURE_IDX["backdrop"], backdrop_values, present[num:])
+
+def precompute_batch(
+        movies: List[dict],
+        indices: Sequence[int],
+        features: Dict[str, torch.Tensor],
+        sbert_encoder,
+        words: WordEmbedding,
+        img_encoder=None,
+        text_batch_size: int = 64,
+        image_batch_size: int = 32,
+        num_workers: int = 0,
+        cache: Optional[EmbeddingCache] = None
+):
+    """
+    Encodes a batch of movies one modality at a time and writes the results
+    into the preallocated feature tensors at the given indices.
+
+    Args:
+        movies: movie rows from mappings['movie_database']
+        indices: array index of every movie (mappings['tmdb_to_idx'])
+        features: dict from allocate_features, updated in place
+        img_encoder: CNN for posters/backdrops, None to leave images to
+            a separate precompute_image_features pass
+        cache: optional EmbeddingCache consulted before the text/image encoders
+    """
+    indices = torch.as_tensor(indices, dtype=torch.long)
+    mask = features["mask"]
+
+    # Text
+    texts = build_texts(movies)
+    present = torch.tensor([t is not None for t in texts], dtype=torch.bool)
+    values = None
+    if present.any():
+        values = encode_texts([t for t in texts if t is not None], sbert_encoder, text_batch_size, cache)
+    _set_batch(features["text"], mask, indices, FEATURE_IDX["text"], values, present)
+
+    # Keywords
+    values, present = words.encode_batch([movie.get("keywords") for movie in movies])
+    _set_batch(features["keywords"], mask, indices, FEATURE_IDX["keywords"], values[present], present)
+
+    precompute_metadata(movies, indices, features)
+
+    # Images
+    if img_encoder is not None:
+        precompute_image_features(movies, indices, features, img_encoder, image_batch_size, num_workers, cache=cache)
+
+def precompute_shard(
+        movies: List[dict],
+        sbert_encoder,
+        img_encoder,
+        words: WordEmbedding,
+        text_dim: int,
+        image_dim: int,
+        movie_batch_size: int = 1024,
+        text_batch_size: int = 64,
+        image_batch_size: int = 32,
+        num_workers: int = 0,
+        cache: Optional[EmbeddingCache] = None
+) -> Dict[str, torch.Tensor]:
+    """
+    Encodes a contiguous run of movies into a fresh features dict whose row i
+    belongs to movies[i].
+    """
+    features = allocate_features(len(movies), text_dim, image_dim)
+    indices = list(range(len(movies)))
+
+    for start in tqdm(range(0, len(movies), movie_batch_size), desc="Encoding movies", leave=False):
+        end = start + movie_batch_size
+
+        precompute_batch(
+            movies=movies[start:end],
+            indices=indices[start:end],
+            features=features,
+            sbert_encoder=sbert_encoder,
+            words=words,
+            text_batch_size=text_batch_size,
+            cache=cache
+        )
+
+    torch.cuda.empty_cache()
+
+    # one image loader over the whole shard keeps the decode workers busy
+    precompute_image_features(
+        movies,
+        indices,
+        features,
+        img_encoder,
+        batch_size=image_batch_size,
+        num_workers=num_workers,
+        progress=True,
+        cache=cache
+    )
+
+    return features
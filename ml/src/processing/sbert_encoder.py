@@ -7,8 +7,8 @@ class MPNetEncoder(nn.Module):
         self.model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
         self.output_dim = 768
 
-    def forward(self, texts):
-        return self.model.encode(texts, convert_to_tensor=True, normalize_embeddings=True)
+    def forward(self, texts, batch_size=32):
+        return self.model.encode(texts, batch_size=batch_size, convert_to_tensor=True, normalize_embeddings=True)
 
 class MiniLMEncoder(nn.Module):
     def __init__(self):
@@ -16,5 +16,5 @@ class MiniLMEncoder(nn.Module):
         self.model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
         self.output_dim = 384
 
-    def forward(self, texts):
-        return self.model.encode(texts, convert_to_tensor=True, normalize_embeddings=True)
\ No newline at end of file
+    def forward(self, texts, batch_size=32):
+        return self.model.encode(texts, batch_size=batch_size, convert_to_tensor=True, normalize_embeddings=True)
\ No newline at end of file
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import torch
+
+def shard_ranges(num_movies: int, shard_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits [0, num_movies) into contiguous [start, end) index ranges.
+    """
+    return [(start, min(start + shard_size, num_movies)) for start in range(0, num_movies, shard_size)]
+
+def shard_path(shard_dir: str, shard_id: int) -> str:
+    return os.path.join(shard_dir, f"shard_{shard_id:05d}.pt")
+
+def _manifest_path(shard_dir: str, shard_id: int) -> str:
+    return os.path.join(shard_dir, f"shard_{shard_id:05d}.json")
+
+def _ids_digest(tmdb_ids: Sequence[int]) -> str:
+    return hashlib.sha1(",".join(str(i) for i in tmdb_ids).encode()).hexdigest()
+
+def is_shard_done(shard_dir: str, shard_id: int, tmdb_ids: Sequence[int], inputs_digest: str) -> bool:
+    """
+    A shard is done when its manifest exists and was written for the same
+    movies from the same inputs (see precompute.shard_inputs_digest), so
+    shards left over from an older mappings.pkl, an earlier 03_feature_eng
+    run or other encoders are recomputed.
+    """
+    manifest = _manifest_path(shard_dir, shard_id)
+    if not os.path.exists(manifest) or not os.path.exists(shard_path(shard_dir, shard_id)):
+        return False
+
+    with open(manifest) as f:
+        meta = json.load(f)
+
+    return (
+        meta.get("num_movies") == len(tmdb_ids)
+        and meta.get("ids_sha1") == _ids_digest(tmdb_ids)
+        and meta.get("inputs_sha1") == inputs_digest
+    )
+
+def save_shard(shard_dir: str, shard_id: int, tmdb_ids: Sequence[int], inputs_digest: str, features: Dict[str, torch.Tensor]):
+    """
+    Writes the shard features (mask rows included) and then its manifest.
+    Both go through a temp file + rename so a crash never leaves a shard
+    that looks complete.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+
+    path = shard_path(shard_dir, shard_id)
+    torch.save(features, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+    manifest = _manifest_path(shard_dir, shard_id)
+    with open(manifest + ".tmp", "w") as f:
+        json.dump({"num_movies": len(tmdb_ids), "ids_sha1": _ids_digest(tmdb_ids), "inputs_sha1": inputs_digest}, f)
+    os.replace(manifest + ".tmp", manifest)
+
+def assemble_shards(shard_dir: str, num_shards: int) -> Dict[str, torch.Tensor]:
+    """
+    Copies shards 0..num_shards-1 into the full features dict, one shard in
+    memory at a time.
+    """
+    sizes = []
+    for shard_id in range(num_shards):
+        with open(_manifest_path(shard_dir, shard_id)) as f:
+            sizes.append(json.load(f)["num_movies"])
+
+    features = None
+    start = 0
+    for shard_id, size in enumerate(sizes):
+        shard = torch.load(shard_path(shard_dir, shard_id))
+
+        if features is None:
+            features = {
+                key: torch.empty((sum(sizes), *value.shape[1:]), dtype=value.dtype)
+                for key, value in shard.items()
+            }
+
+        for key, value in shard.items():
+            features[key][start:start + size] = value
+        start += size
+
+    return features
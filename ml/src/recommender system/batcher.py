@@ -0,0 +1,160 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
+
+class RecommenderBatcher:
+    """
+    asyncio front end for MovieRecommender that micro-batches concurrent
+    requests: calls are queued, collected for up to max_wait_ms or
+    max_batch_size requests, and run as one batched SBERT encode + FAISS
+    search on a worker thread. Each caller awaits only its own result.
+
+    Example:
+        >> batcher = RecommenderBatcher(recommender)
+        >> await batcher.search_by_text("heist in space", k=5)
+        >> await batcher.close()
+    """
+
+    def __init__(self, recommender, max_batch_size: int = 64, max_wait_ms: float = 3.0):
+        """
+        Args:
+            recommender: MovieRecommender instance
+            max_batch_size: dispatch as soon as this many requests are queued
+            max_wait_ms: latency budget, how long the first request of a batch
+                waits for others to join
+        """
+        self.recommender = recommender
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        # one thread: FAISS and torch parallelize each batch themselves
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.worker = None
+
+    def _ensure_started(self):
+        # created lazily so the batcher binds to the loop it is used from
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _submit(self, kind, query, k, exclude_input=False):
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((kind, query, k, exclude_input, future))
+        return await future
+
+    async def search_by_movie_ids(self, movie_ids: Union[int, List[int]], k: int = 10,
+                                  exclude_input: bool = True) -> List[int]:
+        """Batched MovieRecommender.search_by_movie_ids"""
+        return await self._submit('movie_ids', movie_ids, k, exclude_input)
+
+    async def search_by_text(self, query: str, k: int = 10) -> List[int]:
+        """Batched MovieRecommender.search_by_text"""
+        return await self._submit('text', query, k)
+
+    async def search_hybrid(self, movie_ids=None, text_query=None, movie_weight: float = 0.5, k: int = 10) -> List[int]:
+        """Batched MovieRecommender.search_hybrid"""
+        spec = {'movie_ids': movie_ids, 'text_query': text_query, 'movie_weight': movie_weight}
+        return await self._submit('hybrid', spec, k)
+
+    async def _collect(self, batch):
+        # first request blocks, the rest join until the deadline or a full batch.
+        # Fills the caller's list so a cancelled collect loses no requests
+        batch.append(await self.queue.get())
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = []
+            try:
+                await self._collect(batch)
+
+                # one batched call per (kind, exclude_input)
+                groups = {}
+                for request in batch:
+                    groups.setdefault((request[0], request[3]), []).append(request)
+
+                for (kind, exclude_input), requests in groups.items():
+                    outcomes = await loop.run_in_executor(self.executor, self._search_group, kind, exclude_input, requests)
+
+                    for (*_, future), (result, error) in zip(requests, outcomes):
+                        if future.done():  # caller went away
+                            continue
+                        if error is not None:
+                            future.set_exception(error)
+                        else:
+                            future.set_result(result)
+            except asyncio.CancelledError:
+                # close(): requests already taken off the queue but not yet
+                # answered would otherwise never resolve
+                for *_, future in batch:
+                    future.cancel()
+                raise
+
+    def _search_group(self, kind, exclude_input, requests):
+        """
+        Runs on the worker thread. Searches with the largest k in the group
+        and truncates per request. If the batch call fails (e.g. one request
+        has no valid movie IDs), requests are retried one by one so only the
+        bad ones get the error.
+
+        Returns:
+            list of (result, error) in request order
+        """
+        queries = [request[1] for request in requests]
+        k = max(request[2] for request in requests)
+
+        try:
+            results = self._search_batch(kind, exclude_input, queries, k)
+            return [(result[:request[2]], None) for result, request in zip(results, requests)]
+        except Exception as error:
+            if len(requests) == 1:
+                return [(None, error)]
+
+        outcomes = []
+        for query, request in zip(queries, requests):
+            try:
+                outcomes.append((self._search_batch(kind, exclude_input, [query], request[2])[0], None))
+            except Exception as error:
+                outcomes.append((None, error))
+        return outcomes
+
+    def _search_batch(self, kind, exclude_input, queries, k):
+        if kind == 'movie_ids':
+            return self.recommender.search_by_movie_ids_batch(queries, k, exclude_input)
+        if kind == 'text':
+            return self.recommender.search_by_text_batch(queries, k)
+        return self.recommender.search_hybrid_batch(queries, k)
+
+    async def close(self):
+        """
+        Stops the worker task and thread. Every request that has not been
+        answered yet (queued, being collected or being searched) is cancelled.
+        """
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+            while not self.queue.empty():
+                *_, future = self.queue.get_nowait()
+                future.cancel()
+
+        # waits for a batch still running on the thread, off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
@@ -1,9 +1,121 @@
+import hashlib
+import json
 import os
 import pickle
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import torch
 import torch.nn.functional as F
 import faiss
-from typing import List, Optional, Union
+from typing import Hashable, List, Optional, Union
+
+# flat is exact, the others are approximate (see MovieRecommender.recall_report)
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def _replace_file(path, write):
+    """
+    Calls write(tmp_path) on a temp file unique to this process, next to
+    path, then renames it over path. Workers building the same index at
+    once each rename a complete file instead of sharing one .tmp name.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        # mkstemp creates 0600, give the file the mode open() would have so
+        # workers running as another user can read it
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _save_npy(path, array):
+    # np.save appends .npy to string paths, so write through a file object
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+def _save_json(path, obj):
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2)
+
+def normalize_query(query: str) -> str:
+    """Cache key form of a text query: trimmed, lowercased, single spaces"""
+    return _WHITESPACE_RE.sub(" ", query).strip().lower()
+
+class QueryCache:
+    """
+    Thread-safe bounded LRU with an optional TTL and hit/miss counters.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: Optional[float] = None):
+        """
+        Args:
+            max_size: entries kept, least recently used are dropped first
+            ttl: seconds an entry stays valid, None for no expiry
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, stored_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        """Returns the cached value or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+def embeddings_fingerprint(path, sample_bytes=1 << 20):
+    """
+    Cheap checksum of embeddings.pt: size, mtime and a sha1 of its first and
+    last MiB. Changes whenever generate_embeddings writes a new file.
+    """
+    stat = os.stat(path)
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        sha1.update(f.read(sample_bytes))
+        f.seek(max(0, stat.st_size - sample_bytes))
+        sha1.update(f.read(sample_bytes))
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{sha1.hexdigest()}"
 
 class MovieRecommender:
     """
@@ -16,21 +128,65 @@ class MovieRecommender:
     - Hybrid (movies + text)
     """
 
-    def __init__(self, sbert_encoder, embeddings_path="data/processed/embeddings.pt", mappings_path="data/processed/mappings_no_dataset.pkl"):
+    def __init__(self, sbert_encoder, embeddings_path="data/processed/embeddings.pt", mappings_path="data/processed/mappings_no_dataset.pkl",
+                 index_type="flat", nlist=None, nprobe=16, hnsw_m=32, ef_search=64, pq_m=64, pq_nbits=8,
+                 index_dir=None, persist_index=True,
+                 query_cache_size=4096, query_cache_ttl=None, result_cache_size=0):
         """
         Args:
         	sbert_encoder: MPNetEncoder instance for text queries
             embeddings_path: Path to embeddings .pt file (from generate_embeddings.py)
             mappings_path: Path to mappings.pkl
+            index_type: one of INDEX_TYPES
+            nlist: IVF cells (ivf_flat / ivf_pq), default 4 * sqrt(num_movies)
+            nprobe: IVF cells visited per query, higher is slower but more exact
+            hnsw_m: HNSW graph degree
+            ef_search: HNSW candidate list size per query, higher is slower but more exact
+            pq_m: PQ sub-quantizers (ivf_pq), must divide the embedding dims
+            pq_nbits: bits per PQ code (ivf_pq)
+            index_dir: where built indices are persisted, default <embeddings dir>/faiss
+            persist_index: reuse / write the persisted indices (see _load_index_files)
+            query_cache_size: cached text query embeddings (0 disables)
+            query_cache_ttl: seconds a cached query embedding / result stays valid, None for no expiry
+            result_cache_size: cached search_by_text results (0 disables)
         """
         if not os.path.exists(embeddings_path):
             raise ValueError("embeddings are required.")
 
-        #load embeddings
-        embeddings_dict = torch.load(embeddings_path)
-
-        self.fused_embeddings = embeddings_dict.get('fused')
-        self.text_embeddings = embeddings_dict.get('text_only')
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type must be one of {INDEX_TYPES}, got {index_type}")
+
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+
+        self.index_dir = index_dir or os.path.join(os.path.dirname(embeddings_path), "faiss")
+        fingerprint = embeddings_fingerprint(embeddings_path)
+        self.fingerprint = fingerprint
+
+        # Persisted indices are memory-mapped, so workers start without
+        # touching embeddings.pt and share the index pages
+        if not (persist_index and self._load_index_files(fingerprint)):
+            #load embeddings
+            embeddings_dict = torch.load(embeddings_path)
+
+            self.fused_embeddings = embeddings_dict.get('fused')
+            self.text_embeddings = embeddings_dict.get('text_only')
+
+            # Build FAISS indices
+            self.fused_index = self._build_faiss_index(self.fused_embeddings)
+            self.text_index = self._build_faiss_index(self.text_embeddings)
+
+            if persist_index:
+                try:
+                    self._save_index_files(fingerprint)
+                except OSError as e:
+                    # e.g. index_dir owned by the build user, serve from memory
+                    print(f"Could not persist FAISS indices to {self.index_dir}: {e}")
 
         self.num_movies, self.embed_dim = self.fused_embeddings.shape
 
@@ -44,104 +200,436 @@ class MovieRecommender:
         # Text encoder
         self.sbert = sbert_encoder
 
-        # Build FAISS indices
-        self.fused_index = self._build_faiss_index(self.fused_embeddings)
-        self.text_index = self._build_faiss_index(self.text_embeddings)
+        # normalized query -> normalized embedding, and
+        # (query, k, index_version) -> search_by_text result
+        self.query_cache = QueryCache(query_cache_size, query_cache_ttl) if query_cache_size else None
+        self.result_cache = QueryCache(result_cache_size, query_cache_ttl) if result_cache_size else None
 
     def _build_faiss_index(self, embeddings):
         """Build FAISS index for fast similarity search"""
         embeddings_np = embeddings.cpu().numpy().astype('float32')
         faiss.normalize_L2(embeddings_np)
+        num, dim = embeddings_np.shape
+
+        if self.index_type == "flat":
+            # Use IndexFlatIP (Inner Product) for cosine similarity on normalized vectors
+            index = faiss.IndexFlatIP(dim)
+
+        elif self.index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = max(2 * self.hnsw_m, 128)
+
+        else:
+            nlist = self.nlist or max(1, int(4 * np.sqrt(num)))
+            quantizer = faiss.IndexFlatIP(dim)
+
+            if self.index_type == "ivf_flat":
+                index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            else:
+                index = faiss.IndexIVFPQ(quantizer, dim, nlist, self.pq_m, self.pq_nbits, faiss.METRIC_INNER_PRODUCT)
+
+            # ~256 training points per cell is plenty for k-means
+            sample = np.random.default_rng(0).permutation(num)[:256 * nlist]
+            index.train(embeddings_np[np.sort(sample)])
 
-        # Use IndexFlatIP (Inner Product) for cosine similarity on normalized vectors
-        index = faiss.IndexFlatIP(embeddings_np.shape[1])
         index.add(embeddings_np)
+        self._set_search_params(index)
 
         return index
 
-    def search_by_movie_ids(self, movie_ids: Union[int, List[int]], k: int = 10,
-                           exclude_input: bool = True) -> List[dict]:
+    def _index_params(self, fingerprint):
+        # everything the persisted files depend on
+        return {
+            'fingerprint': fingerprint,
+            'index_type': self.index_type,
+            'nlist': self.nlist,
+            'hnsw_m': self.hnsw_m,
+            'pq_m': self.pq_m,
+            'pq_nbits': self.pq_nbits
+        }
+
+    def _index_paths(self):
+        # fused, text, fused embeddings, meta
+        return (
+            os.path.join(self.index_dir, f"fused_{self.index_type}.faiss"),
+            os.path.join(self.index_dir, f"text_{self.index_type}.faiss"),
+            os.path.join(self.index_dir, "fused.npy"),
+            os.path.join(self.index_dir, f"meta_{self.index_type}.json")
+        )
+
+    def _save_index_files(self, fingerprint):
         """
-        Find similar movies based on one or more input movies
+        Writes both indices and the fused embeddings next to embeddings.pt.
+        Every file goes through a per-process temp name + rename and the
+        meta file is written last, so concurrent workers never read a
+        partial set.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        fused_path, text_path, embeddings_path, meta_path = self._index_paths()
 
-        Args:
-            movie_ids: Single TMDB ID or list of TMDB IDs
-            k: Number of recommendations
-            exclude_input: Don't return the input movies in results
+        for index, path in ((self.fused_index, fused_path), (self.text_index, text_path)):
+            _replace_file(path, lambda tmp_path: faiss.write_index(index, tmp_path))
+
+        fused = self.fused_embeddings.cpu().numpy().astype('float32')
+        _replace_file(embeddings_path, lambda tmp_path: _save_npy(tmp_path, fused))
+
+        params = self._index_params(fingerprint)
+        _replace_file(meta_path, lambda tmp_path: _save_json(tmp_path, params))
+
+    def _load_index_files(self, fingerprint):
+        """
+        Memory-maps the persisted indices and fused embeddings if they were
+        built from this exact embeddings.pt with the same index settings.
 
         Returns:
-            List of dicts with movie info and similarity scores
+            True if loaded, False if they have to be (re)built
+        """
+        fused_path, text_path, embeddings_path, meta_path = self._index_paths()
+        if not os.path.exists(meta_path):
+            return False
+
+        # IVF: MMAP maps the inverted lists. Flat / HNSW storage: MMAP_IFC
+        # maps the codes in place (newer faiss), the two can't be combined
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            io_flags = faiss.IO_FLAG_MMAP
+        else:
+            io_flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+
+        # unreadable (permissions) or corrupt files fall back to a rebuild.
+        # faiss raises RuntimeError, json / np.load raise ValueError
+        try:
+            with open(meta_path) as f:
+                if json.load(f) != self._index_params(fingerprint):
+                    return False
+
+            if not all(os.path.exists(path) for path in (fused_path, text_path, embeddings_path)):
+                return False
+
+            fused_index = faiss.read_index(fused_path, io_flags)
+            text_index = faiss.read_index(text_path, io_flags)
+
+            # copy-on-write mapping, pages are shared between workers
+            fused_embeddings = torch.from_numpy(np.load(embeddings_path, mmap_mode='c'))
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Could not load persisted FAISS indices from {self.index_dir}, rebuilding: {e}")
+            return False
+
+        self.fused_index = fused_index
+        self.text_index = text_index
+        self._set_search_params(self.fused_index)
+        self._set_search_params(self.text_index)
+
+        self.fused_embeddings = fused_embeddings
+        self.text_embeddings = None  # only needed to build text_index
+
+        return True
+
+    def _set_search_params(self, index):
+        if self.index_type == "hnsw":
+            index.hnsw.efSearch = self.ef_search
+        elif self.index_type in ("ivf_flat", "ivf_pq"):
+            index.nprobe = self.nprobe
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Retunes nprobe (IVF) / efSearch (HNSW) of both indices without rebuilding.
+        """
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
 
-        Example:
-            >> recommender.search_by_movie_ids(603, k=5)
-            >> recommender.search_by_movie_ids([27205, 157336], k=10)
+        self._set_search_params(self.fused_index)
+        self._set_search_params(self.text_index)
+
+    def recall_report(self, num_queries=1000, k=10, seed=0):
+        """
+        Recall@k and single-query latency of the fused index against an
+        exact flat index, using random catalog movies as queries.
+
+        Returns:
+            dict with recall, and mean / p50 / p99 latency in ms for both indices
+        """
+        embeddings_np = self.fused_embeddings.cpu().numpy().astype('float32')
+        faiss.normalize_L2(embeddings_np)
+
+        exact = faiss.IndexFlatIP(embeddings_np.shape[1])
+        exact.add(embeddings_np)
+
+        rng = np.random.default_rng(seed)
+        queries = embeddings_np[rng.choice(len(embeddings_np), size=min(num_queries, len(embeddings_np)), replace=False)]
+
+        def timed_search(index):
+            latencies = []
+            results = []
+            for query in queries:
+                start = time.perf_counter()
+                _, ids = index.search(query[None, :], k)
+                latencies.append(1000 * (time.perf_counter() - start))
+                results.append(ids[0])
+            return np.array(results), np.array(latencies)
+
+        exact_ids, exact_ms = timed_search(exact)
+        approx_ids, approx_ms = timed_search(self.fused_index)
+
+        hits = sum(len(set(a[a >= 0]) & set(e)) for a, e in zip(approx_ids, exact_ids))
+
+        def latency(ms):
+            return {'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)), 'p99_ms': float(np.percentile(ms, 99))}
+
+        return {
+            'index_type': self.index_type,
+            'recall': hits / (len(queries) * k),
+            'index': latency(approx_ms),
+            'flat': latency(exact_ms)
+        }
+
+    def _encode_texts(self, texts: List[str]) -> torch.Tensor:
         """
+        Encode text queries -> [len(texts), dim] L2-normalized. Queries are
+        normalized first; cached ones skip SBERT, the rest are encoded in
+        one batch (each distinct query once).
+        """
+        texts = [normalize_query(text) for text in texts]
+
+        distinct = list(dict.fromkeys(texts))
+
+        embeddings = {}
+        if self.query_cache is not None:
+            for text in distinct:
+                cached = self.query_cache.get(text)
+                if cached is not None:
+                    embeddings[text] = cached
+
+        missing = [text for text in distinct if text not in embeddings]
+        if missing:
+            with torch.no_grad():
+                text_emb = torch.as_tensor(self.sbert.encode(missing))
+            text_emb = F.normalize(text_emb.reshape(len(missing), -1).float(), p=2, dim=1)
+
+            for text, emb in zip(missing, text_emb):
+                embeddings[text] = emb
+                if self.query_cache is not None:
+                    # emb is a row view, a clone lets the batch tensor be freed
+                    self.query_cache.put(text, emb.clone())
+
+        return torch.stack([embeddings[text] for text in texts])
+
+    @property
+    def index_version(self):
+        # anything that changes search results for the same query
+        return (self.fingerprint, self.index_type, self.nprobe, self.ef_search)
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the query embedding and result caches"""
+        return {
+            'query_embeddings': self.query_cache.stats() if self.query_cache is not None else None,
+            'results': self.result_cache.stats() if self.result_cache is not None else None
+        }
+
+    def _movie_indices(self, movie_ids: Union[int, List[int]]) -> List[int]:
         if isinstance(movie_ids, int): # singel movie_id
             movie_ids = [movie_ids]
+        return [self.tmdb_to_idx[id] for id in movie_ids if id in self.tmdb_to_idx]
+
+    def _search(self, index, query_embeddings: torch.Tensor, k: int, exclude: Optional[List[List[int]]] = None) -> List[List[int]]:
+        """
+        One index.search for all queries, then per query: drop excluded and
+        missing (-1, approximate indices may find fewer than k) hits and map
+        the rest to TMDB ids.
+        """
+        query_embeddings = F.normalize(query_embeddings, p=2, dim=1) #l2 norm
+        query_np = query_embeddings.cpu().numpy().astype('float32')
+
+        # Search (get extra results if excluding input)
+        num_results = k + max((len(e) for e in exclude), default=0) if exclude else k
+        scores, result_indices = index.search(query_np, num_results)
+
+        # Convert to results
+        all_results = []
+        for row, row_indices in enumerate(result_indices):
+            skip = set(exclude[row]) if exclude else ()
+
+            results = []
+            for idx in row_indices:
+                if idx < 0 or idx in skip:
+                    continue
+
+                tmdb_id = self.idx_to_tmdb[idx]
+                results.append(tmdb_id)
+
+                if len(results) >= k:
+                    break
+
+            all_results.append(results)
+
+        return all_results
 
-        # Get embeddings for input movies
-        indices = [self.tmdb_to_idx[id] for id in movie_ids if id in self.tmdb_to_idx]
+    def search_by_movie_ids_batch(self, movie_id_lists: List[Union[int, List[int]]], k: int = 10,
+                                  exclude_input: bool = True) -> List[List[int]]:
+        """
+        search_by_movie_ids for many queries with a single index search
+
+        Args:
+            movie_id_lists: one TMDB ID or list of TMDB IDs per query
+            k: Number of recommendations per query
+            exclude_input: Don't return a query's input movies in its results
+
+        Returns:
+            one list of TMDB IDs per query
+
+        Example:
+            >> recommender.search_by_movie_ids_batch([603, [27205, 157336]], k=10)
+        """
+        all_indices = []
+        for movie_ids in movie_id_lists:
+            # Get embeddings for input movies
+            indices = self._movie_indices(movie_ids)
+
+            if not indices:
+                raise ValueError(f"No valid movie IDs found in: {movie_ids}")
 
-        if not indices:
-            raise ValueError(f"No valid movie IDs found in: {movie_ids}")
+            all_indices.append(indices)
 
         # Average embeddings if multiple movies
-        query_embedding = self.fused_embeddings[indices].mean(dim=0, keepdim=True)
+        query_embeddings = torch.stack([self.fused_embeddings[indices].mean(dim=0) for indices in all_indices])
 
-        # Normalize
-        query_embedding = F.normalize(query_embedding, p=2, dim=1) #l2 norm
-        query_np = query_embedding.cpu().numpy().astype('float32')
+        return self._search(self.fused_index, query_embeddings, k, exclude=all_indices if exclude_input else None)
 
-        # Search (get extra results if excluding input)
-        num_results = k + len(indices) if exclude_input else k
-        scores, result_indices = self.fused_index.search(query_np, num_results)
+    def search_by_text_batch(self, queries: List[str], k: int = 10) -> List[List[int]]:
+        """
+        search_by_text for many queries: one SBERT encode and one index search
 
-        # Convert to results
-        results = []
-        for score, idx in zip(scores[0], result_indices[0]):
-            if exclude_input and idx in indices:
-                continue
+        Args:
+            queries: Natural language queries
+            k: Number of recommendations per query
 
-            tmdb_id = self.idx_to_tmdb[idx]
-            results.append(tmdb_id)
+        Returns:
+            one list of TMDB IDs per query
+        """
+        if not queries:
+            return []
 
-            if len(results) >= k:
-                break
+        if self.result_cache is None:
+            # Encode text queries
+            return self._search(self.text_index, self._encode_texts(queries), k)
 
-        return results
+        keys = [(normalize_query(query), k, self.index_version) for query in queries]
+        results = [self.result_cache.get(key) for key in keys]
 
-    def search_by_text(self, query: str, k: int = 10) -> List[dict]:
+        # only uncached queries are encoded and searched
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            found = self._search(self.text_index, self._encode_texts([queries[i] for i in missing]), k)
+            for i, result in zip(missing, found):
+                self.result_cache.put(keys[i], result)
+                results[i] = result
+
+        # copies, so callers can't modify cached lists
+        return [list(result) for result in results]
+
+    def search_hybrid_batch(self, specs: List[dict], k: int = 10) -> List[List[int]]:
         """
-        Find movies based on text query
+        search_hybrid for many queries: all text parts are encoded in one SBERT
+        batch and all queries go through one index search
 
         Args:
-            query: Natural language query like "sci-fi movies about AI"
+            specs: one dict per query with the search_hybrid arguments
+                movie_ids, text_query and movie_weight (default 0.5)
+            k: Number of recommendations per query
+
+        Returns:
+            one list of TMDB IDs per query
+
+        Example:
+            >> recommender.search_hybrid_batch([
+            ...     {'movie_ids': 550, 'text_query': "but with a clif hanger", 'movie_weight': 0.7},
+            ...     {'text_query': "heist in space"}
+            ... ])
+        """
+        if not specs:
+            return []
+
+        texts = [spec['text_query'] for spec in specs if spec.get('text_query') is not None]
+        text_embeddings = iter(self._encode_texts(texts)) if texts else iter(())
+
+        query_embeddings = []
+        for spec in specs:
+            movie_ids = spec.get('movie_ids')
+            text_query = spec.get('text_query')
+            movie_weight = spec.get('movie_weight', 0.5)
+
+            if movie_ids is None and text_query is None:
+                raise ValueError("Must provide either movie_ids or text_query")
+
+            embeddings_to_combine = []
+            weights = []
+
+            # Add movie embeddings
+            if movie_ids is not None:
+                indices = self._movie_indices(movie_ids)
+                if indices:
+                    embeddings_to_combine.append(self.fused_embeddings[indices].mean(dim=0))
+                    weights.append(movie_weight)
+
+            # Add text embedding
+            if text_query is not None:
+                text_emb = next(text_embeddings)
+
+                # Project to same embedding space
+                if text_emb.shape[0] != self.embed_dim:
+                    # Simple padding/truncation
+                    if text_emb.shape[0] < self.embed_dim:
+                        text_emb = F.pad(text_emb, (0, self.embed_dim - text_emb.shape[0]))
+                    else:
+                        text_emb = text_emb[:self.embed_dim]
+
+                embeddings_to_combine.append(text_emb)
+                weights.append(1 - movie_weight)
+
+            if not embeddings_to_combine:
+                raise ValueError(f"No valid movie IDs found in: {movie_ids}")
+
+            # Weighted combination
+            qstacked = torch.stack([w * emb for w, emb in zip(weights, embeddings_to_combine)])
+            query_embeddings.append(torch.sum(qstacked, dim=0))
+
+        return self._search(self.fused_index, torch.stack(query_embeddings), k)
+
+    def search_by_movie_ids(self, movie_ids: Union[int, List[int]], k: int = 10,
+                           exclude_input: bool = True) -> List[dict]:
+        """
+        Find similar movies based on one or more input movies
+
+        Args:
+            movie_ids: Single TMDB ID or list of TMDB IDs
             k: Number of recommendations
+            exclude_input: Don't return the input movies in results
 
         Returns:
             List of dicts with movie info and similarity scores
 
         Example:
-            >> recommender.search_by_text("cyberpunk action with philosophy")
+            >> recommender.search_by_movie_ids(603, k=5)
+            >> recommender.search_by_movie_ids([27205, 157336], k=10)
         """
-        # Encode text query
-        with torch.no_grad():
-            query_emb = self.sbert.encode(query).unsqueeze(0)
+        return self.search_by_movie_ids_batch([movie_ids], k, exclude_input)[0]
 
-        # Normalize
-        query_emb = F.normalize(query_emb, p=2, dim=1) #l2 norm
-        query_np = query_emb.cpu().numpy().astype('float32')
+    def search_by_text(self, query: str, k: int = 10) -> List[dict]:
+        """
+        Find movies based on text query
 
-        # Search
-        scores, result_indices = self.text_index.search(query_np, k)
+        Args:
+            query: Natural language query like "sci-fi movies about AI"
+            k: Number of recommendations
 
-        # Convert to results
-        results = []
-        for score, idx in zip(scores[0], result_indices[0]):
-            tmdb_id = self.idx_to_tmdb[idx]
-            results.append(tmdb_id)
+        Returns:
+            List of dicts with movie info and similarity scores
 
-        return results
+        Example:
+            >> recommender.search_by_text("cyberpunk action with philosophy")
+        """
+        return self.search_by_text_batch([query], k)[0]
 
     def search_hybrid(self, movie_ids: Optional[Union[int, List[int]]] = None,
                      text_query: Optional[str] = None,
@@ -166,52 +654,14 @@ class MovieRecommender:
             ...     movie_weight=0.7
             ... )
         """
-        if movie_ids is None and text_query is None:
-            raise ValueError("Must provide either movie_ids or text_query")
-
-        embeddings_to_combine = []
-        weights = []
-
-        # Add movie embeddings
-        if movie_ids is not None:
-            if isinstance(movie_ids, int):
-                movie_ids = [movie_ids]
+        spec = {'movie_ids': movie_ids, 'text_query': text_query, 'movie_weight': movie_weight}
+        return self.search_hybrid_batch([spec], k)[0]
 
-            indices = [self.tmdb_to_idx[mid] for mid in movie_ids if mid in self.tmdb_to_idx]
-            if indices:
-                movie_emb = self.fused_embeddings[indices].mean(dim=0, keepdim=True)
-                embeddings_to_combine.append(movie_emb)
-                weights.append(movie_weight)
-
-        # Add text embedding
-        if text_query is not None:
-            with torch.no_grad():
-                text_emb = self.sbert.encode(text_query).unsqueeze(0)
-
-            # Project to same embedding space
-            if text_emb.shape[1] != self.embed_dim:
-                # Simple padding/truncation
-                if text_emb.shape[1] < self.embed_dim:
-                    text_emb = F.pad(text_emb, (0, self.embed_dim - text_emb.shape[1]))
-                else:
-                    text_emb = text_emb[:, :self.embed_dim]
-
-            embeddings_to_combine.append(text_emb)
-            weights.append(1 - movie_weight)
-
-        # Weighted combination
-        qstacked = torch.stack([w * emb for w, emb in zip(weights, embeddings_to_combine)])
-        query_embedding = torch.sum(qstacked, dim=0)
-        query_embedding = F.normalize(query_embedding, p=2, dim=1)
-
-        # Search
-        query_np = query_embedding.cpu().numpy().astype('float32')
-        scores, result_indices = self.fused_index.search(query_np, k)
-
-        # Convert to results
-        results = []
-        for score, idx in zip(scores[0], result_indices[0]):
-            tmdb_id = self.idx_to_tmdb[idx]
-            results.append(tmdb_id)
+if __name__ == '__main__':
+    import sys
 
-        return results
+    # Index build step: run once after generate_embeddings so API workers
+    # start from the persisted, memory-mapped indices. Build the index type
+    # the workers are configured with, e.g. `python recommender.py hnsw`
+    index_type = sys.argv[1] if len(sys.argv) > 1 else "flat"
+    MovieRecommender(sbert_encoder=None, index_type=index_type)
@@ -0,0 +1,93 @@
+import glob
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+def to_cpu(obj):
+    """
+    Deep copy of a (nested) state_dict with every tensor copied to CPU, so
+    training can keep updating the originals while the copy is written.
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+def atomic_save(obj, path):
+    """
+    torch.save to a temp file next to path, then rename over it: path is
+    either the old or the new checkpoint, never a partial one.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class AsyncCheckpointWriter:
+    """
+    Writes checkpoints on a background thread. save() only pays for the
+    CPU snapshot; serialization and disk I/O overlap with the next epoch.
+    At most one write is in flight, so at most one extra copy of the
+    state is held in memory.
+    """
+
+    def __init__(self, save_dir, keep_last=3, pattern="model_epoch_*.pt"):
+        """
+        Args:
+            save_dir: checkpoint directory
+            keep_last: how many files matching pattern to keep (None keeps all)
+            pattern: glob of the numbered checkpoints subject to retention
+        """
+        self.save_dir = save_dir
+        self.keep_last = keep_last
+        self.pattern = pattern
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+        os.makedirs(save_dir, exist_ok=True)
+
+    def save(self, checkpoint, *filenames):
+        """
+        Snapshots checkpoint to CPU and writes it to every filename (relative
+        to save_dir) in the background. Waits for the previous write first.
+        """
+        self.wait()
+        snapshot = to_cpu(checkpoint)
+        paths = [os.path.join(self.save_dir, name) for name in filenames]
+        self.pending = self.executor.submit(self._write, snapshot, paths)
+
+    def _write(self, snapshot, paths):
+        for path in paths:
+            atomic_save(snapshot, path)
+        self._prune()
+
+    def _prune(self):
+        if self.keep_last is None:
+            return
+
+        def number(path):
+            found = re.findall(r"\d+", os.path.basename(path))
+            return int(found[-1]) if found else -1
+
+        paths = sorted(glob.glob(os.path.join(self.save_dir, self.pattern)), key=number)
+        for path in paths[:-self.keep_last] if self.keep_last > 0 else paths:
+            os.remove(path)
+
+    def wait(self):
+        """
+        Blocks until the in-flight write is done, re-raising its error if it failed.
+        """
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
@@ -1,11 +1,19 @@
 import os
 import torch
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, BatchSampler, DistributedSampler, RandomSampler, SequentialSampler
+
+from .feature_store import load_features
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(BASE_DIR, "../.."))
 DIR = os.path.join(PROJECT_ROOT, "data", "processed")
 
+FEATURE_KEYS = [
+    'text', 'keywords', 'genres', 'poster_file', 'backdrop_file',
+    'year', 'month_sin', 'month_cos', 'vote_average', 'vote_count', 'popularity', 'runtime',
+    'mask'
+]
+
 class FusionDataset(Dataset):
 
     def __init__(
@@ -13,7 +21,8 @@ class FusionDataset(Dataset):
             features_file: str,
             seed: int = 42
     ):
-        self.features = torch.load(os.path.join(DIR, features_file))
+        # a feature store directory is memory-mapped and shared by all workers
+        self.features = load_features(os.path.join(DIR, features_file))
         self.num_movies = self.features['text'].shape[0]
 
     def __len__(self):
@@ -36,15 +45,91 @@ class FusionDataset(Dataset):
             'mask': self.features['mask'][idx]
         }
 
-def get_dataloader(features_file, batch_size= 256, shuffle=True, num_workers=4, pin_memory=True, persistent_workers=True):
+    def __getitems__(self, indices):
+        """
+        Whole batch at once: one fancy-index gather per feature key instead
+        of a dict per sample that the collate step has to re-stack.
+        """
+        # sorted rows keep reads from the memory-mapped store sequential
+        idx = torch.as_tensor(sorted(indices), dtype=torch.long)
+        return {key: self.features[key][idx] for key in FEATURE_KEYS}
+
+def _collate_batch(batch):
+    # __getitems__ already returns stacked tensors
+    return batch
+
+def get_dataloader(features_file, batch_size= 256, shuffle=True, num_workers=4, pin_memory=True, persistent_workers=True, drop_last=False, rank=0, world_size=1):
     ds = FusionDataset(features_file)
 
+    if world_size > 1:
+        # each rank gets its own 1/world_size of the movies
+        sampler = DistributedSampler(ds, num_replicas=world_size, rank=rank, shuffle=shuffle)
+    else:
+        sampler = RandomSampler(ds) if shuffle else SequentialSampler(ds)
+
     return DataLoader(
             ds,
-            batch_size=batch_size,
-            shuffle=shuffle,
+            batch_sampler=BatchSampler(sampler, batch_size=batch_size, drop_last=drop_last),
+            collate_fn=_collate_batch,
             num_workers=num_workers,
             pin_memory=pin_memory,
-            persistent_workers=persistent_workers,
-            prefetch_factor=2
-        )
\ No newline at end of file
+            persistent_workers=persistent_workers and num_workers > 0,
+            prefetch_factor=2 if num_workers > 0 else None
+        )
+
+class DeviceBatchLoader:
+    """
+    Keeps every feature key resident on one device and draws shuffled
+    batches with an on-device randperm, for feature sets that fit in
+    device memory. Iterates like a DataLoader (len() batches of dicts)
+    without workers, pinning or per-batch host to device copies.
+    """
+
+    def __init__(self, features_file, batch_size=256, shuffle=True, device="cpu", drop_last=False, rank=0, world_size=1, seed=42):
+        features = load_features(os.path.join(DIR, features_file))
+        self.device = torch.device(device)
+        self.features = {key: features[key].to(self.device) for key in FEATURE_KEYS}
+        self.num_movies = self.features['text'].shape[0]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.rank = rank
+        self.world_size = world_size
+        self.seed = seed
+        self.epoch = 0
+
+        # every rank draws the same number of rows
+        self.num_rows = self.num_movies // world_size
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_rows // self.batch_size
+        return (self.num_rows + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if self.shuffle:
+            # same permutation on every rank, each takes its own stride
+            generator = torch.Generator(device=self.device)
+            generator.manual_seed(self.seed + self.epoch)
+            order = torch.randperm(self.num_movies, device=self.device, generator=generator)
+        else:
+            order = torch.arange(self.num_movies, device=self.device)
+
+        order = order[self.rank:self.num_rows * self.world_size:self.world_size]
+
+        for i in range(len(self)):
+            idx = order[i * self.batch_size:(i + 1) * self.batch_size]
+            yield {key: value[idx] for key, value in self.features.items()}
+
+def set_epoch(dataloader, epoch):
+    """
+    Reseeds the shuffle of a DataLoader built by get_dataloader or a
+    DeviceBatchLoader, so distributed ranks agree on each epoch's order.
+    """
+    if isinstance(dataloader, DeviceBatchLoader):
+        dataloader.set_epoch(epoch)
+    elif isinstance(dataloader.batch_sampler.sampler, DistributedSampler):
+        dataloader.batch_sampler.sampler.set_epoch(epoch)
@@ -0,0 +1,65 @@
+import os
+
+import torch
+import torch.distributed as dist
+
+def setup_distributed(device):
+    """
+    Joins the process group when launched by torchrun (WORLD_SIZE > 1),
+    nccl on GPUs and gloo otherwise. A plain `python contrastive_train.py`
+    stays single-process.
+
+    Args:
+        device: device to use when not distributed
+
+    Returns:
+        rank, world_size, device of this process
+    """
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1:
+        return 0, 1, device
+
+    rank = int(os.environ["RANK"])
+    local_rank = int(os.environ.get("LOCAL_RANK", 0))
+
+    if torch.cuda.is_available():
+        torch.cuda.set_device(local_rank)
+        device = torch.device("cuda", local_rank)
+        backend = "nccl"
+    else:
+        device = torch.device("cpu")
+        backend = "gloo"
+
+    dist.init_process_group(backend=backend, rank=rank, world_size=world_size)
+    return rank, world_size, device
+
+def cleanup_distributed():
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+class GatherLayer(torch.autograd.Function):
+    """
+    all_gather that keeps the graph: backward sums the incoming gradients
+    over all ranks and hands each rank the slice of its own input.
+    """
+
+    @staticmethod
+    def forward(ctx, tensor):
+        gathered = [torch.zeros_like(tensor) for _ in range(dist.get_world_size())]
+        dist.all_gather(gathered, tensor.contiguous())
+        return tuple(gathered)
+
+    @staticmethod
+    def backward(ctx, *grads):
+        grad = torch.stack(grads)
+        dist.all_reduce(grad)
+        return grad[dist.get_rank()]
+
+def all_gather(tensor):
+    """
+    Concatenates tensor [batch, ...] from every rank along dim 0 (rank order),
+    differentiable w.r.t. the local part. Identity when not distributed.
+    """
+    if not (dist.is_available() and dist.is_initialized()) or dist.get_world_size() == 1:
+        return tensor
+    return torch.cat(GatherLayer.apply(tensor), dim=0)
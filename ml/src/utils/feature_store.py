@@ -0,0 +1,67 @@
+import json
+import os
+from typing import Dict
+
+import numpy as np
+import torch
+
+META_FILE = "meta.json"
+
+def save_feature_store(features: Dict[str, torch.Tensor], store_dir: str):
+    """
+    Writes every feature key to its own contiguous <key>.npy file plus a
+    meta.json with dtype and shape per key. meta.json is written last, so a
+    store without it is incomplete.
+
+    Args:
+        features: dict in the features.pt layout (text, keywords, ..., mask)
+        store_dir: directory of the store, e.g. data/processed/features
+    """
+    os.makedirs(store_dir, exist_ok=True)
+
+    meta = {}
+    for key, value in features.items():
+        array = value.detach().cpu().contiguous().numpy()
+
+        path = os.path.join(store_dir, f"{key}.npy")
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(path + ".tmp", path)
+
+        meta[key] = {"dtype": str(array.dtype), "shape": list(array.shape)}
+
+    with open(os.path.join(store_dir, META_FILE + ".tmp"), "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(os.path.join(store_dir, META_FILE + ".tmp"), os.path.join(store_dir, META_FILE))
+
+def open_feature_store(store_dir: str) -> Dict[str, torch.Tensor]:
+    """
+    Memory-maps every feature key of a store. Pages come from the OS cache
+    and are shared by all processes (e.g. DataLoader workers) reading the
+    same store; the mapping is copy-on-write so in-place edits stay private.
+    """
+    with open(os.path.join(store_dir, META_FILE)) as f:
+        meta = json.load(f)
+
+    features = {}
+    for key, info in meta.items():
+        array = np.load(os.path.join(store_dir, f"{key}.npy"), mmap_mode="c")
+
+        if str(array.dtype) != info["dtype"] or list(array.shape) != info["shape"]:
+            raise ValueError(f"Feature '{key}' in {store_dir} does not match {META_FILE}")
+
+        features[key] = torch.from_numpy(array)
+
+    return features
+
+def load_features(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Opens a feature store directory, or torch.loads a legacy features .pt file.
+    A missing store directory falls back to <path>.pt (e.g. features ->
+    features.pt) written by older precompute runs.
+    """
+    if os.path.isdir(path):
+        return open_feature_store(path)
+    if not os.path.exists(path) and os.path.exists(path + ".pt"):
+        return torch.load(path + ".pt")
+    return torch.load(path)
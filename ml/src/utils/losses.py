@@ -12,7 +12,7 @@ this is kind of a similar idea as to what word2vec does
 import torch
 import torch.nn.functional as F
 
-def contrastive_loss(z_i, z_j, temperature=0.1):
+def contrastive_loss(z_i, z_j, temperature=0.1, chunk_size=None, negatives=None):
     """
     Computes NT-Xent loss (InfoNCE) for self-supervised learning.
 
@@ -20,6 +20,10 @@ def contrastive_loss(z_i, z_j, temperature=0.1):
         z_i: Embeddings for View 1 (e.g., text+genre) [Batch, Dim]
         z_j: Embeddings for View 2 (e.g., poster+keywords) [Batch, Dim]
         temperature: Scalar scaling factor
+        chunk_size: rows of the similarity matrix held in memory at once.
+            None computes the full (2B x 2B) matrix in one go
+        negatives: optional [K, Dim] extra negatives (e.g. a MemoryQueue),
+            compared against every row but never back-propagated through
     Returns:
         Scalar loss value
     """
@@ -28,6 +32,9 @@ def contrastive_loss(z_i, z_j, temperature=0.1):
     # Concatenate the two views
     z = torch.cat([z_i, z_j], dim=0)
 
+    if chunk_size is not None and chunk_size < 2 * batch_size:
+        return ChunkedNTXent.apply(z, temperature, chunk_size, negatives)
+
     # Compute similarity between every movie and every other movie (and view)
     sim_matrix = (z @ z.t()) / temperature
     # the reason this is dot becuase hte length of z
@@ -49,5 +56,82 @@ def contrastive_loss(z_i, z_j, temperature=0.1):
     min_val = torch.finfo(sim_matrix.dtype).min
     sim_matrix.masked_fill_(mask, min_val)
 
+    # Queue entries are extra columns: negatives for every row, never targets
+    if negatives is not None:
+        extra = (z @ negatives.detach().to(z.dtype).t()) / temperature
+        sim_matrix = torch.cat([sim_matrix, extra], dim=1)
+
     # Calculate Loss
-    return F.cross_entropy(sim_matrix, labels)
\ No newline at end of file
+    return F.cross_entropy(sim_matrix, labels)
+
+def _positive_index(rows, batch_size):
+    # row k of view 1 matches k + batch_size of view 2 and vice versa
+    return torch.where(rows < batch_size, rows + batch_size, rows - batch_size)
+
+class ChunkedNTXent(torch.autograd.Function):
+    """
+    Same loss as contrastive_loss, but the similarity matrix is processed
+    chunk_size rows at a time: forward keeps only the per-row log-sum-exp,
+    backward recomputes each row block instead of storing it. Peak memory
+    is O(chunk_size * 2B) instead of O((2B)^2), and the self-similarity
+    diagonal is masked by index instead of a dense eye mask.
+    """
+
+    @staticmethod
+    def forward(ctx, z, temperature, chunk_size, negatives=None):
+        n = z.shape[0]
+        batch_size = n // 2
+
+        with torch.autocast(device_type=z.device.type, enabled=False):
+            zf = z.float()
+            # columns: the 2B batch rows, then any queued negatives
+            keys = zf if negatives is None else torch.cat([zf, negatives.detach().float()], dim=0)
+            lse = torch.empty(n, device=z.device)
+            positives = torch.empty(n, device=z.device)
+
+            for start in range(0, n, chunk_size):
+                rows = torch.arange(start, min(start + chunk_size, n), device=z.device)
+                local = torch.arange(len(rows), device=z.device)
+
+                sim = (zf[rows] @ keys.t()) / temperature
+                sim[local, rows] = float('-inf')
+
+                lse[rows] = torch.logsumexp(sim, dim=1)
+                positives[rows] = sim[local, _positive_index(rows, batch_size)]
+
+        ctx.save_for_backward(z, keys, lse)
+        ctx.temperature = temperature
+        ctx.chunk_size = chunk_size
+
+        return (lse - positives).mean()
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        z, keys, lse = ctx.saved_tensors
+        temperature, chunk_size = ctx.temperature, ctx.chunk_size
+        n = z.shape[0]
+        batch_size = n // 2
+
+        with torch.autocast(device_type=z.device.type, enabled=False):
+            zf = z.float()
+            grad_z = torch.zeros_like(zf)
+            scale = grad_output.float() / (n * temperature)
+
+            for start in range(0, n, chunk_size):
+                rows = torch.arange(start, min(start + chunk_size, n), device=z.device)
+                local = torch.arange(len(rows), device=z.device)
+
+                sim = (zf[rows] @ keys.t()) / temperature
+                sim[local, rows] = float('-inf')
+
+                # d loss / d sim = softmax - one_hot(positive)
+                grad_sim = torch.exp(sim - lse[rows].unsqueeze(1))
+                grad_sim[local, _positive_index(rows, batch_size)] -= 1
+                grad_sim *= scale
+
+                # sim_ij = z_i . z_j / T contributes to both z_i and z_j
+                # (queued negatives are constants, only the rows get their part)
+                grad_z[rows] += grad_sim @ keys
+                grad_z += grad_sim[:, :n].t() @ zf[rows]
+
+        return grad_z.to(z.dtype), None, None, None
@@ -0,0 +1,69 @@
+import copy
+
+import torch
+
+class MemoryQueue:
+    """
+    Fixed-size FIFO of embeddings from recent batches (MoCo-style), used as
+    extra negatives in contrastive_loss. Entries are detached, so only the
+    current batch is ever back-propagated through.
+    """
+
+    def __init__(self, size, dim, device="cpu"):
+        self.size = size
+        self.buffer = torch.zeros((size, dim), device=device)
+        self.ptr = 0
+        self.filled = 0
+
+    def negatives(self):
+        """
+        Returns:
+            [filled, dim] queued embeddings, or None while the queue is empty
+        """
+        if self.filled == 0:
+            return None
+        return self.buffer[:self.filled]
+
+    @torch.no_grad()
+    def enqueue(self, keys):
+        """
+        Overwrites the oldest entries with keys [batch, dim].
+        """
+        keys = keys.detach().to(self.buffer.dtype)[-self.size:]
+        n = keys.shape[0]
+
+        end = self.ptr + n
+        if end <= self.size:
+            self.buffer[self.ptr:end] = keys
+        else:
+            split = self.size - self.ptr
+            self.buffer[self.ptr:] = keys[:split]
+            self.buffer[:end - self.size] = keys[split:]
+
+        self.ptr = end % self.size
+        self.filled = min(self.filled + n, self.size)
+
+    def state_dict(self):
+        return {'buffer': self.buffer, 'ptr': self.ptr, 'filled': self.filled}
+
+    def load_state_dict(self, state):
+        self.buffer.copy_(state['buffer'])
+        self.ptr = state['ptr']
+        self.filled = state['filled']
+
+def momentum_copy(model):
+    """
+    Frozen copy of model whose weights follow it via momentum_update.
+    """
+    momentum_model = copy.deepcopy(model)
+    for param in momentum_model.parameters():
+        param.requires_grad_(False)
+    return momentum_model
+
+@torch.no_grad()
+def momentum_update(momentum_model, model, momentum):
+    """
+    Exponential moving average: momentum_model = m * momentum_model + (1 - m) * model
+    """
+    for param_k, param_q in zip(momentum_model.parameters(), model.parameters()):
+        param_k.mul_(momentum).add_(param_q.detach(), alpha=1 - momentum)